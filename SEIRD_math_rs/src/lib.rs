@@ -1,7 +1,15 @@
+use ndarray::parallel::prelude::*;
 use ndarray::prelude::*;
-use numpy::{IntoPyArray, PyArray1, PyArray3, PyReadonlyArray2};
+use numpy::{
+    IntoPyArray, PyArray1, PyArray3, PyArray4, PyReadonlyArray1, PyReadonlyArray2,
+    PyReadonlyArray3, PyReadonlyArrayDyn,
+};
+use pyo3::exceptions::{PyRuntimeError, PyValueError};
 use pyo3::prelude::{pymodule, wrap_pyfunction, PyModule, PyResult, Python};
+use pyo3::types::PyDict;
+use pyo3::IntoPy;
 use std::collections::HashMap;
+use std::time::Instant;
 
 struct SeirdArgs {
     beta: f64,
@@ -15,8 +23,24 @@ struct SeirdArgs {
     vac_params: f64,
 }
 
-fn seird(_t: f64, y: &Array1<f64>, c: &SeirdArgs) -> Array1<f64> {
-    let mut dydt = Array::zeros(6);
+impl SeirdArgs {
+    fn new(coeff: ArrayView2<f64>, i: usize, sum_contact: f64, vac_params: f64) -> Self {
+        SeirdArgs {
+            beta: coeff[[0, i]],
+            sigma: coeff[[1, i]],
+            epsilon: coeff[[2, i]],
+            f_s: coeff[[3, i]],
+            gamma_s: coeff[[4, i]],
+            gamma_a: coeff[[5, i]],
+            delta: coeff[[6, i]],
+            sum_contact: sum_contact,
+            vac_params: vac_params,
+        }
+    }
+}
+
+fn seird(_t: f64, y: &[f64; 6], c: &SeirdArgs) -> [f64; 6] {
+    let mut dydt = [0.0; 6];
     let mut diff_v = c.vac_params;
 
     dydt[0] = -c.beta * c.sigma * y[0] * c.sum_contact - diff_v;
@@ -31,8 +55,8 @@ fn seird(_t: f64, y: &Array1<f64>, c: &SeirdArgs) -> Array1<f64> {
     dydt
 }
 
-fn seird_se(_t: f64, y: &Array1<f64>, c: &SeirdArgs) -> Array1<f64> {
-    let mut dydt = Array::zeros(6);
+fn seird_se(_t: f64, y: &[f64; 6], c: &SeirdArgs) -> [f64; 6] {
+    let mut dydt = [0.0; 6];
     let mut diff_v = c.vac_params;
 
     let ratio = y[0] / (y[0] + y[1]);
@@ -58,8 +82,493 @@ fn seird_se(_t: f64, y: &Array1<f64>, c: &SeirdArgs) -> Array1<f64> {
     dydt
 }
 
+/// Vaccination campaigns compiled once from the vac_params dict, so the time
+/// loop never formats or hashes "age_grp_n" keys. Every "age_grp_n" entry is a
+/// flat list of (rate, start, end) triples, one per campaign.
+struct VacSchedule {
+    eff: f64,
+    campaigns: Vec<Vec<(f64, f64, f64)>>,
+}
+
+impl VacSchedule {
+    fn compile(vac_params: &HashMap<String, Vec<f64>>, groups: usize) -> PyResult<Self> {
+        let eff = match vac_params.get("eff") {
+            Some(eff) if eff.is_empty() => {
+                return Err(PyValueError::new_err("vac_params[\"eff\"] is empty"))
+            }
+            Some(eff) => eff[0],
+            None => 0.0,
+        };
+        let campaigns: Vec<Vec<(f64, f64, f64)>> = (1..=groups)
+            .map(|i| match vac_params.get(&format!("age_grp_{}", i)) {
+                Some(p) if p.len() % 3 != 0 => Err(PyValueError::new_err(format!(
+                    "vac_params[\"age_grp_{}\"] must hold (rate, start, end) triples",
+                    i
+                ))),
+                Some(p) => Ok(p.chunks_exact(3).map(|c| (c[0], c[1], c[2])).collect()),
+                None => Ok(Vec::new()),
+            })
+            .collect::<PyResult<_>>()?;
+        Ok(VacSchedule { eff, campaigns })
+    }
+
+    /// Vaccination rate of an age group at time t, summed over the campaigns
+    /// active on that day.
+    fn rate(&self, group: usize, t: f64) -> f64 {
+        self.eff
+            * self.campaigns[group]
+                .iter()
+                .filter(|(_, start, end)| *start <= t && t < *end + 1.0)
+                .map(|(rate, _, _)| rate)
+                .sum::<f64>()
+    }
+
+    /// Dense (T, groups) table of vaccination rates on the time points.
+    fn dense(&self, time_points: &Array1<f64>) -> Array2<f64> {
+        Array2::from_shape_fn((time_points.len(), self.campaigns.len()), |(t, i)| {
+            self.rate(i, time_points[t])
+        })
+    }
+}
+
+type Rhs = fn(f64, &[f64; 6], &SeirdArgs) -> [f64; 6];
+
+/// y + k * h for one RK stage, kept on the stack.
+fn stage(y: &[f64; 6], k: &[f64; 6], h: f64) -> [f64; 6] {
+    std::array::from_fn(|c| y[c] + k[c] * h)
+}
+
+/// Contact matrix of one scenario, dense or in CSR form for large sparse
+/// structures such as regions x age groups.
+enum Coupling<'a> {
+    Dense(ArrayView2<'a, f64>),
+    Csr {
+        indptr: ArrayView1<'a, i64>,
+        indices: ArrayView1<'a, i64>,
+        data: ArrayView1<'a, f64>,
+    },
+}
+
+impl Coupling<'_> {
+    /// Row i of the matrix times x.
+    fn row_dot(&self, i: usize, x: &Array1<f64>) -> f64 {
+        match self {
+            Coupling::Dense(m) => m.row(i).dot(x),
+            Coupling::Csr {
+                indptr,
+                indices,
+                data,
+            } => (indptr[i] as usize..indptr[i + 1] as usize)
+                .map(|k| data[k] * x[indices[k] as usize])
+                .sum(),
+        }
+    }
+}
+
+/// The contact coupling of one scenario over the time steps: a base matrix,
+/// piecewise-constant replacements from given days on, and an optional factor
+/// per (step, group) such as a lockdown schedule.
+struct Contacts<'a> {
+    base: Coupling<'a>,
+    changes: &'a [Coupling<'a>],
+    /// Matrix of every time step, 0 for base and k for changes[k - 1].
+    active: &'a [usize],
+    scale: Option<ArrayView2<'a, f64>>,
+}
+
+impl Contacts<'_> {
+    fn sum_contact(&self, step: usize, i: usize, infectious: &Array1<f64>) -> f64 {
+        let coupling = match self.active[step] {
+            0 => &self.base,
+            k => &self.changes[k - 1],
+        };
+        let sum = coupling.row_dot(i, infectious);
+        match &self.scale {
+            Some(scale) => sum * scale[[step, i]],
+            None => sum,
+        }
+    }
+}
+
+/// Receives the state after every time step, so a solve only keeps what the
+/// caller asked for instead of the whole (6, T, 8) tensor.
+trait Observer {
+    fn observe(&mut self, step: usize, t: f64, y: ArrayView2<f64>);
+}
+
+/// Stores the state of the selected (sorted) steps.
+struct Store<'a> {
+    steps: &'a [usize],
+    next: usize,
+    y: ArrayViewMut3<'a, f64>,
+}
+
+impl<'a> Store<'a> {
+    fn new(steps: &'a [usize], y: ArrayViewMut3<'a, f64>) -> Self {
+        Store { steps, next: 0, y }
+    }
+}
+
+impl Observer for Store<'_> {
+    fn observe(&mut self, step: usize, _t: f64, y: ArrayView2<f64>) {
+        while self.next < self.steps.len() && self.steps[self.next] == step {
+            self.y.slice_mut(s![.., self.next, ..]).assign(&y);
+            self.next += 1;
+        }
+    }
+}
+
+/// Reductions computed on the fly: peak Is/Ia per group, the day of each
+/// peak and D at the last step.
+struct Summary {
+    peak_is: Array1<f64>,
+    t_peak_is: Array1<f64>,
+    peak_ia: Array1<f64>,
+    t_peak_ia: Array1<f64>,
+    final_d: Array1<f64>,
+    t_stop: f64,
+}
+
+impl Summary {
+    const FIELDS: [&'static str; 5] = ["peak_Is", "t_peak_Is", "peak_Ia", "t_peak_Ia", "final_D"];
+
+    fn new(groups: usize) -> Self {
+        Summary {
+            peak_is: Array1::from_elem(groups, f64::NEG_INFINITY),
+            t_peak_is: Array1::zeros(groups),
+            peak_ia: Array1::from_elem(groups, f64::NEG_INFINITY),
+            t_peak_ia: Array1::zeros(groups),
+            final_d: Array1::zeros(groups),
+            t_stop: 0.,
+        }
+    }
+
+    fn fields(&self) -> [&Array1<f64>; 5] {
+        [
+            &self.peak_is,
+            &self.t_peak_is,
+            &self.peak_ia,
+            &self.t_peak_ia,
+            &self.final_d,
+        ]
+    }
+}
+
+impl Observer for Summary {
+    fn observe(&mut self, _step: usize, t: f64, y: ArrayView2<f64>) {
+        for i in 0..y.ncols() {
+            if y[[2, i]] > self.peak_is[i] {
+                self.peak_is[i] = y[[2, i]];
+                self.t_peak_is[i] = t;
+            }
+            if y[[3, i]] > self.peak_ia[i] {
+                self.peak_ia[i] = y[[3, i]];
+                self.t_peak_ia[i] = t;
+            }
+            self.final_d[i] = y[[5, i]];
+        }
+    }
+}
+
+/// Work done by integrate: time steps, RHS evaluations of one age group and
+/// values raised to 0 by the clamp after a step.
+#[derive(Default, Clone, Copy)]
+struct Counters {
+    steps: u64,
+    rhs_evals: u64,
+    clamps: u64,
+}
+
+/// Spans and counters of one solve, see solve_seird_profiled.
+#[derive(Default)]
+struct Profile {
+    spans: Vec<(&'static str, f64)>,
+    counters: Counters,
+    bytes_allocated: usize,
+    t_stop: f64,
+}
+
+impl Profile {
+    /// Ends the span started at since and returns the start of the next one.
+    fn span(&mut self, name: &'static str, since: Instant) -> Instant {
+        let now = Instant::now();
+        self.spans.push((name, (now - since).as_secs_f64()));
+        now
+    }
+
+    fn into_dict<'py>(self, py: Python<'py>) -> PyResult<&'py PyDict> {
+        let spans = PyDict::new(py);
+        for (name, seconds) in self.spans {
+            spans.set_item(name, seconds)?;
+        }
+        let dict = PyDict::new(py);
+        dict.set_item("spans", spans)?;
+        dict.set_item("steps", self.counters.steps)?;
+        dict.set_item("rhs_evals", self.counters.rhs_evals)?;
+        dict.set_item("clamps", self.counters.clamps)?;
+        dict.set_item("bytes_allocated", self.bytes_allocated)?;
+        dict.set_item("t_stop", self.t_stop)?;
+        Ok(dict)
+    }
+}
+
+fn integrate(
+    time_points: &Array1<f64>,
+    y0: ArrayView2<f64>,
+    coeff: ArrayView2<f64>,
+    contacts: &Contacts,
+    vac: ArrayView2<f64>,
+    vac_e: bool,
+    dt: f64,
+    stop_tol: f64,
+    observer: &mut impl Observer,
+    counters: &mut Counters,
+) -> f64 {
+    let f: Rhs = if vac_e { seird_se } else { seird };
+    let dt2 = dt / 2.;
+    // state of the current and next time step, swapped after every step
+    let mut y = y0.to_owned();
+    let mut y_next = Array2::<f64>::zeros(y0.raw_dim());
+    let mut infectious: Array1<f64> = Array1::zeros(y0.ncols());
+    observer.observe(0, time_points[0], y.view());
+    // vaccination keeps moving S to R after the epidemic is over, so the solve
+    // may only stop early once every campaign has ended
+    let vac_end = (0..vac.nrows())
+        .rev()
+        .find(|&t| vac.row(t).iter().any(|&v| v != 0.))
+        .map_or(0, |t| t + 1);
+
+    for t in 0..time_points.len() - 1 {
+        infectious.assign(&y.row(2));
+        infectious += &y.row(3);
+
+        for i in 0..y0.ncols() {
+            let prev_y: [f64; 6] = std::array::from_fn(|c| y[[c, i]]);
+            let sum_contact = contacts.sum_contact(t, i, &infectious);
+
+            let args = SeirdArgs::new(coeff, i, sum_contact, vac[[t, i]]);
+
+            let ct = time_points[t];
+            let k1 = f(ct, &prev_y, &args);
+            let k2 = f(ct + dt2, &stage(&prev_y, &k1, dt2), &args);
+            let k3 = f(ct + dt2, &stage(&prev_y, &k2, dt2), &args);
+            let k4 = f(ct + dt, &stage(&prev_y, &k3, dt), &args);
+
+            for c in 0..6 {
+                let new_y = prev_y[c] + dt * (k1[c] + k2[c] * 2. + k3[c] * 2. + k4[c]) / 6.;
+                if new_y < 0. {
+                    counters.clamps += 1;
+                }
+                y_next[[c, i]] = new_y.max(0.);
+            }
+        }
+        counters.steps += 1;
+        counters.rhs_evals += 4 * y0.ncols() as u64;
+        std::mem::swap(&mut y, &mut y_next);
+        observer.observe(t + 1, time_points[t + 1], y.view());
+
+        if t + 1 >= vac_end && burnt_out(y.view(), stop_tol) {
+            for rest in t + 2..time_points.len() {
+                observer.observe(rest, time_points[rest], y.view());
+            }
+            return time_points[t + 1];
+        }
+    }
+    time_points[time_points.len() - 1]
+}
+
+/// Whether E + Is + Ia dropped below tol in every age group.
+fn burnt_out(y: ArrayView2<f64>, tol: f64) -> bool {
+    (0..y.ncols()).all(|i| y[[1, i]] + y[[2, i]] + y[[3, i]] < tol)
+}
+
+/// The whole (6, groups) system for integrators that recompute the contact
+/// coupling at every stage.
+struct Model<'a> {
+    coeff: ArrayView2<'a, f64>,
+    contacts: ArrayView2<'a, f64>,
+    vac: &'a VacSchedule,
+    f: Rhs,
+}
+
+impl Model<'_> {
+    fn rhs(&self, t: f64, y: ArrayView2<f64>, mut dydt: ArrayViewMut2<f64>) {
+        let groups = y.ncols();
+        for i in 0..groups {
+            let mut sum_contact = 0.0;
+            for j in 0..groups {
+                sum_contact += self.contacts[[i, j]] * (y[[2, j]] + y[[3, j]]);
+            }
+            let args = SeirdArgs::new(self.coeff, i, sum_contact, self.vac.rate(i, t));
+            let y_i: [f64; 6] = std::array::from_fn(|c| y[[c, i]]);
+            let dydt_i = (self.f)(t, &y_i, &args);
+            for c in 0..6 {
+                dydt[[c, i]] = dydt_i[c];
+            }
+        }
+    }
+}
+
+// Dormand–Prince 5(4) tableau, DP_E is the difference of the 5th and 4th
+// order weights and gives the local error estimate.
+const DP_C: [f64; 7] = [0., 1. / 5., 3. / 10., 4. / 5., 8. / 9., 1., 1.];
+const DP_A: [[f64; 6]; 7] = [
+    [0., 0., 0., 0., 0., 0.],
+    [1. / 5., 0., 0., 0., 0., 0.],
+    [3. / 40., 9. / 40., 0., 0., 0., 0.],
+    [44. / 45., -56. / 15., 32. / 9., 0., 0., 0.],
+    [19372. / 6561., -25360. / 2187., 64448. / 6561., -212. / 729., 0., 0.],
+    [9017. / 3168., -355. / 33., 46732. / 5247., 49. / 176., -5103. / 18656., 0.],
+    [35. / 384., 0., 500. / 1113., 125. / 192., -2187. / 6784., 11. / 84.],
+];
+const DP_E: [f64; 7] = [
+    71. / 57600.,
+    0.,
+    -71. / 16695.,
+    71. / 1920.,
+    -17253. / 339200.,
+    22. / 525.,
+    -1. / 40.,
+];
+
+/// Cubic Hermite interpolation between two accepted steps, clamped at 0.
+fn hermite(
+    s: f64,
+    h: f64,
+    y0: &Array2<f64>,
+    f0: &Array2<f64>,
+    y1: &Array2<f64>,
+    f1: &Array2<f64>,
+    mut out: ArrayViewMut2<f64>,
+) {
+    let h00 = (1. + 2. * s) * (1. - s) * (1. - s);
+    let h10 = s * (1. - s) * (1. - s);
+    let h01 = s * s * (3. - 2. * s);
+    let h11 = s * s * (s - 1.);
+    Zip::from(&mut out)
+        .and(y0)
+        .and(f0)
+        .and(y1)
+        .and(f1)
+        .for_each(|o, &a, &fa, &b, &fb| {
+            *o = (h00 * a + h10 * h * fa + h01 * b + h11 * h * fb).max(0.);
+        });
+}
+
+/// Adaptive Dormand–Prince integration of one scenario with dense output on
+/// the (sorted) t_eval points. Returns the number of accepted steps.
+fn integrate_adaptive(
+    time_range: (f64, f64),
+    y0: ArrayView2<f64>,
+    model: &Model,
+    t_eval: ArrayView1<f64>,
+    rtol: f64,
+    atol: f64,
+    mut y_out: ArrayViewMut3<f64>,
+) -> Result<usize, String> {
+    let (mut t, t_end) = time_range;
+    let mut y = y0.to_owned();
+    let mut y_new = y0.to_owned();
+    let mut err = Array2::<f64>::zeros(y0.raw_dim());
+    let mut k: Vec<Array2<f64>> = (0..7).map(|_| Array2::zeros(y0.raw_dim())).collect();
+    model.rhs(t, y.view(), k[0].view_mut());
+
+    let mut next_out = 0;
+    while next_out < t_eval.len() && t_eval[next_out] <= t {
+        y_out.slice_mut(s![.., next_out, ..]).assign(&y);
+        next_out += 1;
+    }
+
+    let scale = |y: &Array2<f64>, y_new: &Array2<f64>, err: &Array2<f64>| {
+        let mut sum = 0.0;
+        Zip::from(y).and(y_new).and(err).for_each(|&a, &b, &e| {
+            let sc = atol + rtol * a.abs().max(b.abs());
+            sum += (e / sc) * (e / sc);
+        });
+        (sum / y.len() as f64).sqrt()
+    };
+
+    // initial step from the size of the state and its derivative
+    let d0 = y.iter().map(|x| x * x).sum::<f64>().sqrt();
+    let d1 = k[0].iter().map(|x| x * x).sum::<f64>().sqrt();
+    let mut h = if d0 > 1e-5 && d1 > 1e-5 { 0.01 * d0 / d1 } else { 1e-3 };
+    h = h.min(t_end - t);
+
+    let mut steps = 0;
+    while t < t_end {
+        if h < 1e-12 * t_end.abs().max(1.) {
+            return Err(format!("step size too small at t = {}", t));
+        }
+        for st in 1..7 {
+            let (done, rest) = k.split_at_mut(st);
+            y_new.assign(&y);
+            for (j, k_j) in done.iter().enumerate() {
+                if DP_A[st][j] != 0. {
+                    y_new.scaled_add(h * DP_A[st][j], k_j);
+                }
+            }
+            model.rhs(t + DP_C[st] * h, y_new.view(), rest[0].view_mut());
+        }
+        err.fill(0.);
+        for (j, k_j) in k.iter().enumerate() {
+            if DP_E[j] != 0. {
+                err.scaled_add(h * DP_E[j], k_j);
+            }
+        }
+        let err_norm = scale(&y, &y_new, &err);
+
+        if err_norm <= 1. {
+            let t_new = if h == t_end - t { t_end } else { t + h };
+            if y_new.iter().any(|&x| x < 0.) {
+                y_new.mapv_inplace(|x| x.max(0.));
+                model.rhs(t_new, y_new.view(), k[6].view_mut());
+            }
+            while next_out < t_eval.len() && t_eval[next_out] <= t_new {
+                let s = (t_eval[next_out] - t) / h;
+                hermite(
+                    s,
+                    h,
+                    &y,
+                    &k[0],
+                    &y_new,
+                    &k[6],
+                    y_out.slice_mut(s![.., next_out, ..]),
+                );
+                next_out += 1;
+            }
+            std::mem::swap(&mut y, &mut y_new);
+            k.swap(0, 6);
+            t = t_new;
+            steps += 1;
+        }
+
+        let factor = if err_norm == 0. {
+            10.
+        } else if err_norm.is_finite() {
+            (0.9 * err_norm.powf(-0.2)).clamp(0.2, 10.)
+        } else {
+            0.2
+        };
+        h = if err_norm <= 1. {
+            h * factor
+        } else {
+            h * factor.min(1.)
+        };
+        h = h.min(t_end - t);
+    }
+    Ok(steps)
+}
+
 #[pymodule]
 fn seird_math(_py: Python, m: &PyModule) -> PyResult<()> {
+    /// Solves one scenario with a fixed step RK4. Returns y of shape (6, T, 8),
+    /// or only the steps nearest to the sorted days in t_out when it is given.
+    /// With stop_tol the solve ends once E + Is + Ia < stop_tol in every group
+    /// and no vaccination is left, and the last state is carried forward;
+    /// solve_seird_profiled returns the day it stopped.
+    /// contact_changes is a pair of sorted days and (K, 8, 8) matrices, each
+    /// replacing contacts from its day on. contact_scale (days, 8) multiplies
+    /// the contacts of every age group day by day, 1 after the last row.
     #[pyfn(m)]
     fn solve_seird<'py>(
         py: Python<'py>,
@@ -70,159 +579,538 @@ fn seird_math(_py: Python, m: &PyModule) -> PyResult<()> {
         vac_params: HashMap<String, Vec<f64>>,
         vac_e: bool,
         dt: f64,
-    ) -> (&'py PyArray1<f64>, &'py PyArray3<f64>) {
+        t_out: Option<PyReadonlyArray1<f64>>,
+        stop_tol: Option<f64>,
+        contact_changes: Option<(Vec<f64>, PyReadonlyArray3<f64>)>,
+        contact_scale: Option<PyReadonlyArray2<f64>>,
+    ) -> PyResult<(&'py PyArray1<f64>, &'py PyArray3<f64>)> {
+        solve_single(
+            py,
+            time_range,
+            y0.as_array(),
+            coeff.as_array(),
+            Coupling::Dense(contacts.as_array()),
+            &contact_changes,
+            contact_scale,
+            &vac_params,
+            vac_e,
+            dt,
+            t_out,
+            stop_tol,
+        )
+        .map(|(t, y, _)| (t, y))
+    }
+
+    /// Solves one scenario like solve_seird and also returns a dict of what the
+    /// solve did: "spans", the seconds spent compiling the schedules,
+    /// allocating, integrating and converting the results, and the counters
+    /// steps, rhs_evals (per age group), clamps (values raised to 0 after a
+    /// step) and bytes_allocated, and t_stop, the day the solve ended (see
+    /// stop_tol).
+    #[pyfn(m)]
+    fn solve_seird_profiled<'py>(
+        py: Python<'py>,
+        time_range: (f64, f64),
+        y0: PyReadonlyArray2<f64>,
+        coeff: PyReadonlyArray2<f64>,
+        contacts: PyReadonlyArray2<f64>,
+        vac_params: HashMap<String, Vec<f64>>,
+        vac_e: bool,
+        dt: f64,
+        t_out: Option<PyReadonlyArray1<f64>>,
+        stop_tol: Option<f64>,
+        contact_changes: Option<(Vec<f64>, PyReadonlyArray3<f64>)>,
+        contact_scale: Option<PyReadonlyArray2<f64>>,
+    ) -> PyResult<(&'py PyArray1<f64>, &'py PyArray3<f64>, &'py PyDict)> {
+        let (t, y, profile) = solve_single(
+            py,
+            time_range,
+            y0.as_array(),
+            coeff.as_array(),
+            Coupling::Dense(contacts.as_array()),
+            &contact_changes,
+            contact_scale,
+            &vac_params,
+            vac_e,
+            dt,
+            t_out,
+            stop_tol,
+        )?;
+        Ok((t, y, profile.into_dict(py)?))
+    }
+
+    /// Solves one scenario like solve_seird, with the contact matrix given in
+    /// CSR form (indptr, indices, data) for large sparse structures such as
+    /// regions x age groups with n groups in total.
+    #[pyfn(m)]
+    fn solve_seird_sparse<'py>(
+        py: Python<'py>,
+        time_range: (f64, f64),
+        y0: PyReadonlyArray2<f64>,
+        coeff: PyReadonlyArray2<f64>,
+        indptr: PyReadonlyArray1<i64>,
+        indices: PyReadonlyArray1<i64>,
+        data: PyReadonlyArray1<f64>,
+        vac_params: HashMap<String, Vec<f64>>,
+        vac_e: bool,
+        dt: f64,
+        t_out: Option<PyReadonlyArray1<f64>>,
+        stop_tol: Option<f64>,
+        contact_scale: Option<PyReadonlyArray2<f64>>,
+    ) -> PyResult<(&'py PyArray1<f64>, &'py PyArray3<f64>)> {
+        let (indptr, indices, data) = (indptr.as_array(), indices.as_array(), data.as_array());
+        let y0 = y0.as_array();
+        let groups = y0.ncols();
+        if indptr.len() != groups + 1
+            || indices.len() != data.len()
+            || indptr[0] != 0
+            || indptr[groups] as usize != data.len()
+            || indptr.iter().zip(indptr.iter().skip(1)).any(|(a, b)| a > b)
+            || indices.iter().any(|&j| j < 0 || j as usize >= groups)
+        {
+            return Err(PyValueError::new_err("invalid CSR contact matrix"));
+        }
+        solve_single(
+            py,
+            time_range,
+            y0,
+            coeff.as_array(),
+            Coupling::Csr {
+                indptr,
+                indices,
+                data,
+            },
+            &None,
+            contact_scale,
+            &vac_params,
+            vac_e,
+            dt,
+            t_out,
+            stop_tol,
+        )
+        .map(|(t, y, _)| (t, y))
+    }
+
+    /// Solves a batch of scenarios: y0 (N, 6, 8), coeff (N, 7, 8) and contacts
+    /// (N, 8, 8) or a single shared (8, 8) matrix. Returns y of shape (N, 6, T, 8),
+    /// T limited to the steps nearest to t_out when it is given. Scenarios are
+    /// spread over `workers` threads (0 uses every core) with the GIL released.
+    /// contact_changes and contact_scale, see solve_seird, apply to every
+    /// scenario.
+    #[pyfn(m)]
+    fn solve_seird_batch<'py>(
+        py: Python<'py>,
+        time_range: (f64, f64),
+        y0: PyReadonlyArray3<f64>,
+        coeff: PyReadonlyArray3<f64>,
+        contacts: PyReadonlyArrayDyn<f64>,
+        vac_params: HashMap<String, Vec<f64>>,
+        vac_e: bool,
+        dt: f64,
+        workers: usize,
+        t_out: Option<PyReadonlyArray1<f64>>,
+        stop_tol: Option<f64>,
+        contact_changes: Option<(Vec<f64>, PyReadonlyArray3<f64>)>,
+        contact_scale: Option<PyReadonlyArray2<f64>>,
+    ) -> PyResult<(&'py PyArray1<f64>, &'py PyArray4<f64>)> {
         let y0 = y0.as_array();
         let coeff = coeff.as_array();
         let contacts = contacts.as_array();
+        let (n, groups) = (y0.shape()[0], y0.shape()[2]);
+        check_batch_shapes(y0, coeff, &contacts)?;
+        let pool = thread_pool(workers)?;
 
         let time_points = ndarray::Array::range(time_range.0, time_range.1 + dt, dt);
-        let mut y: Array3<f64> = Array3::zeros((6, time_points.len(), 8));
-        for i in 0..y0.shape()[0] {
-            y.slice_mut(s![i as usize, 0_usize, ..])
-                .assign(&y0.slice(s![i as usize, ..]));
-        }
-        let beta: Array1<f64> = coeff.slice(s![0_usize, ..]).into_owned();
-        let sigma: Array1<f64> = coeff.slice(s![1_usize, ..]).into_owned();
-        let epsilon: Array1<f64> = coeff.slice(s![2_usize, ..]).into_owned();
-        let f_s: Array1<f64> = coeff.slice(s![3_usize, ..]).into_owned();
-        let gamma_s: Array1<f64> = coeff.slice(s![4_usize, ..]).into_owned();
-        let gamma_a: Array1<f64> = coeff.slice(s![5_usize, ..]).into_owned();
-        let delta: Array1<f64> = coeff.slice(s![6_usize, ..]).into_owned();
-
-        if vac_params.is_empty() {
-            let f = &seird;
-
-            for t in 0..time_points.len() - 1 {
-                for i in 0..8 {
-                    let dt2 = dt / 2.;
-                    let prev_y = y.slice(s![.., t as usize, i as usize]).to_owned();
-                    let infectious = &y.slice(s![2 as usize, t as usize, ..])
-                        + &y.slice(s![3 as usize, t as usize, ..]);
-                    let sum_contact = contacts.slice(s![i as usize, ..]).t().dot(&infectious);
-
-                    let args = SeirdArgs {
-                        beta: beta[i],
-                        sigma: sigma[i],
-                        epsilon: epsilon[i],
-                        f_s: f_s[i],
-                        gamma_s: gamma_s[i],
-                        gamma_a: gamma_a[i],
-                        delta: delta[i],
-                        sum_contact: sum_contact,
-                        vac_params: 0.0,
+        let steps = output_steps(&time_points, dt, t_out)?;
+        let (active, changes) = compile_changes(&time_points, &contact_changes, groups)?;
+        let scale = compile_scale(&time_points, contact_scale, groups)?;
+        let mut y: Array4<f64> = Array4::zeros((n, 6, steps.len(), groups));
+        let vac = VacSchedule::compile(&vac_params, groups)?.dense(&time_points);
+        let mut solve_all = || {
+            y.outer_iter_mut()
+                .into_par_iter()
+                .enumerate()
+                .for_each(|(k, y_k)| {
+                    let contacts_k = Contacts {
+                        base: Coupling::Dense(scenario_contacts(&contacts, k)),
+                        changes: &changes,
+                        active: &active,
+                        scale: scale.as_ref().map(|scale| scale.view()),
                     };
+                    integrate(
+                        &time_points,
+                        y0.index_axis(Axis(0), k),
+                        coeff.index_axis(Axis(0), k),
+                        &contacts_k,
+                        vac.view(),
+                        vac_e,
+                        dt,
+                        stop_tol.unwrap_or(0.),
+                        &mut Store::new(&steps, y_k),
+                        &mut Counters::default(),
+                    );
+                })
+        };
+        py.allow_threads(|| match pool {
+            Some(pool) => pool.install(solve_all),
+            None => solve_all(),
+        });
+        let t = steps.iter().map(|&step| time_points[step]).collect::<Array1<f64>>();
+        Ok((t.into_pyarray(py), y.into_pyarray(py)))
+    }
 
-                    let ct = time_points[t];
-                    let k1 = f(ct, &prev_y, &args);
-                    let k2 = f(ct + dt2, &(&prev_y + &k1 * dt2), &args);
-                    let k3 = f(ct + dt2, &(&prev_y + &k2 * dt2), &args);
-                    let k4 = f(ct + dt, &(&prev_y + &k3 * dt), &args);
+    /// Solves a batch of scenarios like solve_seird_batch, but keeps only
+    /// reductions computed during the solve. Returns a dict with peak_Is,
+    /// t_peak_Is, peak_Ia, t_peak_Ia and final_D, each of shape (N, 8), and
+    /// t_stop of shape (N,), the day each solve ended (see stop_tol).
+    #[pyfn(m)]
+    fn solve_seird_summary<'py>(
+        py: Python<'py>,
+        time_range: (f64, f64),
+        y0: PyReadonlyArray3<f64>,
+        coeff: PyReadonlyArray3<f64>,
+        contacts: PyReadonlyArrayDyn<f64>,
+        vac_params: HashMap<String, Vec<f64>>,
+        vac_e: bool,
+        dt: f64,
+        workers: usize,
+        stop_tol: Option<f64>,
+        contact_changes: Option<(Vec<f64>, PyReadonlyArray3<f64>)>,
+        contact_scale: Option<PyReadonlyArray2<f64>>,
+    ) -> PyResult<&'py PyDict> {
+        let y0 = y0.as_array();
+        let coeff = coeff.as_array();
+        let contacts = contacts.as_array();
+        let (n, groups) = (y0.shape()[0], y0.shape()[2]);
+        check_batch_shapes(y0, coeff, &contacts)?;
+        let pool = thread_pool(workers)?;
 
-                    let new_y =
-                        (&prev_y + dt * (&k1 + &k2 * 2. + &k3 * 2. + &k4) / 6.).mapv(|x| x.max(0.));
-                    y.slice_mut(s![.., t + 1 as usize, i as usize])
-                        .assign(&new_y);
-                }
-            }
-        } else {
-            if vac_e {
-                let f = &seird_se;
-                for t in 0..time_points.len() - 1 {
-                    for i in 0..8 {
-                        let dt2 = dt / 2.;
-                        let prev_y = y.slice(s![.., t as usize, i as usize]).to_owned();
-                        let infectious = &y.slice(s![2 as usize, t as usize, ..])
-                            + &y.slice(s![3 as usize, t as usize, ..]);
-                        let sum_contact = contacts.slice(s![i as usize, ..]).t().dot(&infectious);
-                        let vac_param: f64;
-
-                        if vac_params[&("age_grp_".to_string() + &(i + 1).to_string())][1]
-                            <= time_points[t]
-                            && time_points[t]
-                                < vac_params[&("age_grp_".to_string() + &(i + 1).to_string())][2]
-                                    + 1.0
-                        {
-                            vac_param = vac_params["eff"][0]
-                                * vac_params[&("age_grp_".to_string() + &(i + 1).to_string())][0];
-                        } else {
-                            vac_param = 0.0;
-                        }
-
-                        let args = SeirdArgs {
-                            beta: beta[i],
-                            sigma: sigma[i],
-                            epsilon: epsilon[i],
-                            f_s: f_s[i],
-                            gamma_s: gamma_s[i],
-                            gamma_a: gamma_a[i],
-                            delta: delta[i],
-                            sum_contact: sum_contact,
-                            vac_params: vac_param,
-                        };
-
-                        let ct = time_points[t];
-                        let k1 = f(ct, &prev_y, &args);
-                        let k2 = f(ct + dt2, &(&prev_y + &k1 * dt2), &args);
-                        let k3 = f(ct + dt2, &(&prev_y + &k2 * dt2), &args);
-                        let k4 = f(ct + dt, &(&prev_y + &k3 * dt), &args);
-
-                        let new_y = (&prev_y + dt * (&k1 + &k2 * 2. + &k3 * 2. + &k4) / 6.)
-                            .mapv(|x| x.max(0.));
-                        y.slice_mut(s![.., t + 1 as usize, i as usize])
-                            .assign(&new_y);
-                    }
-                }
-            } else {
-                let f = &seird;
-                for t in 0..time_points.len() - 1 {
-                    for i in 0..8 {
-                        let dt2 = dt / 2.;
-                        let prev_y = y.slice(s![.., t as usize, i as usize]).to_owned();
-                        let infectious = &y.slice(s![2 as usize, t as usize, ..])
-                            + &y.slice(s![3 as usize, t as usize, ..]);
-                        let sum_contact = contacts.slice(s![i as usize, ..]).t().dot(&infectious);
-                        let vac_param: f64;
-
-                        if vac_params[&("age_grp_".to_string() + &(i + 1).to_string())][1]
-                            <= time_points[t]
-                            && time_points[t]
-                                < vac_params[&("age_grp_".to_string() + &(i + 1).to_string())][2]
-                                    + 1.0
-                        {
-                            vac_param = vac_params["eff"][0]
-                                * vac_params[&("age_grp_".to_string() + &(i + 1).to_string())][0];
-                        } else {
-                            vac_param = 0.0;
-                        }
-
-                        let args = SeirdArgs {
-                            beta: beta[i],
-                            sigma: sigma[i],
-                            epsilon: epsilon[i],
-                            f_s: f_s[i],
-                            gamma_s: gamma_s[i],
-                            gamma_a: gamma_a[i],
-                            delta: delta[i],
-                            sum_contact: sum_contact,
-                            vac_params: vac_param,
-                        };
-
-                        let ct = time_points[t];
-                        let k1 = f(ct, &prev_y, &args);
-                        let k2 = f(ct + dt2, &(&prev_y + &k1 * dt2), &args);
-                        let k3 = f(ct + dt2, &(&prev_y + &k2 * dt2), &args);
-                        let k4 = f(ct + dt, &(&prev_y + &k3 * dt), &args);
-
-                        let new_y = (&prev_y + dt * (&k1 + &k2 * 2. + &k3 * 2. + &k4) / 6.)
-                            .mapv(|x| x.max(0.));
-                        y.slice_mut(s![.., t + 1 as usize, i as usize])
-                            .assign(&new_y);
-                    }
-                }
-            }
+        let time_points = ndarray::Array::range(time_range.0, time_range.1 + dt, dt);
+        let (active, changes) = compile_changes(&time_points, &contact_changes, groups)?;
+        let scale = compile_scale(&time_points, contact_scale, groups)?;
+        let vac = VacSchedule::compile(&vac_params, groups)?.dense(&time_points);
+        let solve_all = || {
+            (0..n)
+                .into_par_iter()
+                .map(|k| {
+                    let contacts_k = Contacts {
+                        base: Coupling::Dense(scenario_contacts(&contacts, k)),
+                        changes: &changes,
+                        active: &active,
+                        scale: scale.as_ref().map(|scale| scale.view()),
+                    };
+                    let mut summary = Summary::new(groups);
+                    summary.t_stop = integrate(
+                        &time_points,
+                        y0.index_axis(Axis(0), k),
+                        coeff.index_axis(Axis(0), k),
+                        &contacts_k,
+                        vac.view(),
+                        vac_e,
+                        dt,
+                        stop_tol.unwrap_or(0.),
+                        &mut summary,
+                        &mut Counters::default(),
+                    );
+                    summary
+                })
+                .collect::<Vec<Summary>>()
+        };
+        let summaries = py.allow_threads(|| match pool {
+            Some(pool) => pool.install(solve_all),
+            None => solve_all(),
+        });
+
+        let dict = PyDict::new(py);
+        for (field, name) in Summary::FIELDS.iter().enumerate() {
+            let stacked = Array2::from_shape_fn((n, groups), |(k, i)| {
+                summaries[k].fields()[field][i]
+            });
+            dict.set_item(*name, stacked.into_pyarray(py).into_py(py))?;
+        }
+        let t_stop = summaries.iter().map(|summary| summary.t_stop).collect::<Array1<f64>>();
+        dict.set_item("t_stop", t_stop.into_pyarray(py).into_py(py))?;
+        Ok(dict)
+    }
+
+    /// Solves one scenario with an adaptive Dormand–Prince 5(4) integrator and
+    /// returns the solution interpolated onto the sorted t_eval days, so y has
+    /// shape (6, len(t_eval), 8). rtol and atol bound the local error per step.
+    /// stop_tol, contact_changes and contact_scale are not supported yet and
+    /// raise a ValueError.
+    #[pyfn(m)]
+    fn solve_seird_adaptive<'py>(
+        py: Python<'py>,
+        time_range: (f64, f64),
+        y0: PyReadonlyArray2<f64>,
+        coeff: PyReadonlyArray2<f64>,
+        contacts: PyReadonlyArray2<f64>,
+        vac_params: HashMap<String, Vec<f64>>,
+        vac_e: bool,
+        t_eval: PyReadonlyArray1<f64>,
+        rtol: f64,
+        atol: f64,
+        stop_tol: Option<f64>,
+        contact_changes: Option<(Vec<f64>, PyReadonlyArray3<f64>)>,
+        contact_scale: Option<PyReadonlyArray2<f64>>,
+    ) -> PyResult<(&'py PyArray1<f64>, &'py PyArray3<f64>)> {
+        if stop_tol.is_some() || contact_changes.is_some() || contact_scale.is_some() {
+            return Err(PyValueError::new_err(
+                "the adaptive solver supports neither stop_tol nor contact schedules",
+            ));
         }
-        (time_points.into_pyarray(py), y.into_pyarray(py))
+        let y0 = y0.as_array();
+        let (coeff, contacts) = (coeff.as_array(), contacts.as_array());
+        check_shapes(y0, coeff, &Coupling::Dense(contacts))?;
+        let t_eval = t_eval.as_array();
+        if t_eval.iter().zip(t_eval.iter().skip(1)).any(|(a, b)| a > b)
+            || t_eval.iter().any(|&t| t < time_range.0 || t > time_range.1)
+        {
+            return Err(PyValueError::new_err(
+                "t_eval must be sorted and lie within time_range",
+            ));
+        }
+
+        let vac = VacSchedule::compile(&vac_params, y0.ncols())?;
+        let model = Model {
+            coeff,
+            contacts,
+            vac: &vac,
+            f: if vac_e { seird_se } else { seird },
+        };
+        let mut y: Array3<f64> = Array3::zeros((6, t_eval.len(), y0.ncols()));
+        py.allow_threads(|| {
+            integrate_adaptive(time_range, y0, &model, t_eval, rtol, atol, y.view_mut())
+        })
+        .map_err(PyRuntimeError::new_err)?;
+        Ok((t_eval.to_owned().into_pyarray(py), y.into_pyarray(py)))
     }
+
     m.add_wrapped(wrap_pyfunction!(solve_seird))?;
+    m.add_wrapped(wrap_pyfunction!(solve_seird_profiled))?;
+    m.add_wrapped(wrap_pyfunction!(solve_seird_sparse))?;
+    m.add_wrapped(wrap_pyfunction!(solve_seird_batch))?;
+    m.add_wrapped(wrap_pyfunction!(solve_seird_summary))?;
+    m.add_wrapped(wrap_pyfunction!(solve_seird_adaptive))?;
     Ok(())
 }
+
+fn check_shapes(y0: ArrayView2<f64>, coeff: ArrayView2<f64>, base: &Coupling) -> PyResult<()> {
+    let groups = y0.ncols();
+    if y0.nrows() != 6 {
+        return Err(PyValueError::new_err("y0 must have shape (6, n)"));
+    }
+    if coeff.shape() != [7, groups] {
+        return Err(PyValueError::new_err("coeff must have shape (7, n)"));
+    }
+    if let Coupling::Dense(contacts) = base {
+        if contacts.shape() != [groups, groups] {
+            return Err(PyValueError::new_err("contacts must have shape (n, n)"));
+        }
+    }
+    Ok(())
+}
+
+fn check_batch_shapes(
+    y0: ArrayView3<f64>,
+    coeff: ArrayView3<f64>,
+    contacts: &ArrayViewD<f64>,
+) -> PyResult<()> {
+    let (n, groups) = (y0.shape()[0], y0.shape()[2]);
+    if y0.shape()[1] != 6 {
+        return Err(PyValueError::new_err("y0 must have shape (N, 6, n)"));
+    }
+    if coeff.shape() != [n, 7, groups] {
+        return Err(PyValueError::new_err("coeff must have shape (N, 7, n)"));
+    }
+    if contacts.shape() != [groups, groups] && contacts.shape() != [n, groups, groups] {
+        return Err(PyValueError::new_err(
+            "contacts must have shape (n, n) or (N, n, n)",
+        ));
+    }
+    Ok(())
+}
+
+/// Indices of the time steps nearest to the requested output days, or every
+/// step when t_out is None.
+fn output_steps(
+    time_points: &Array1<f64>,
+    dt: f64,
+    t_out: Option<PyReadonlyArray1<f64>>,
+) -> PyResult<Vec<usize>> {
+    let t_out = match t_out {
+        Some(t_out) => t_out,
+        None => return Ok((0..time_points.len()).collect()),
+    };
+    let t_out = t_out.as_array();
+    if t_out.iter().zip(t_out.iter().skip(1)).any(|(a, b)| a > b) {
+        return Err(PyValueError::new_err("t_out must be sorted"));
+    }
+    t_out
+        .iter()
+        .map(|&t| {
+            let step = ((t - time_points[0]) / dt).round();
+            if step < 0. || step as usize >= time_points.len() {
+                Err(PyValueError::new_err("t_out must lie within time_range"))
+            } else {
+                Ok(step as usize)
+            }
+        })
+        .collect()
+}
+
+fn thread_pool(workers: usize) -> PyResult<Option<rayon::ThreadPool>> {
+    if workers == 0 {
+        return Ok(None);
+    }
+    rayon::ThreadPoolBuilder::new()
+        .num_threads(workers)
+        .build()
+        .map(Some)
+        .map_err(|e| PyRuntimeError::new_err(e.to_string()))
+}
+
+fn scenario_contacts<'a>(contacts: &ArrayViewD<'a, f64>, k: usize) -> ArrayView2<'a, f64> {
+    let contacts_k = if contacts.ndim() == 2 {
+        contacts.clone()
+    } else {
+        contacts.clone().index_axis_move(Axis(0), k)
+    };
+    contacts_k.into_dimensionality::<Ix2>().unwrap()
+}
+
+/// Solves one scenario with the contact coupling already chosen, see
+/// solve_seird. Also returns the time spent compiling the schedules,
+/// allocating, integrating and converting the results, with the counters of
+/// the solve.
+fn solve_single<'py>(
+    py: Python<'py>,
+    time_range: (f64, f64),
+    y0: ArrayView2<f64>,
+    coeff: ArrayView2<f64>,
+    base: Coupling,
+    contact_changes: &Option<(Vec<f64>, PyReadonlyArray3<f64>)>,
+    contact_scale: Option<PyReadonlyArray2<f64>>,
+    vac_params: &HashMap<String, Vec<f64>>,
+    vac_e: bool,
+    dt: f64,
+    t_out: Option<PyReadonlyArray1<f64>>,
+    stop_tol: Option<f64>,
+) -> PyResult<(&'py PyArray1<f64>, &'py PyArray3<f64>, Profile)> {
+    let mut profile = Profile::default();
+    let start = Instant::now();
+    let groups = y0.ncols();
+    check_shapes(y0, coeff, &base)?;
+    let time_points = ndarray::Array::range(time_range.0, time_range.1 + dt, dt);
+    let steps = output_steps(&time_points, dt, t_out)?;
+    let (active, changes) = compile_changes(&time_points, contact_changes, groups)?;
+    let scale = compile_scale(&time_points, contact_scale, groups)?;
+    let contacts = Contacts {
+        base,
+        changes: &changes,
+        active: &active,
+        scale: scale.as_ref().map(|scale| scale.view()),
+    };
+    let vac = VacSchedule::compile(vac_params, groups)?.dense(&time_points);
+    let start = profile.span("compile", start);
+
+    let mut y: Array3<f64> = Array3::zeros((6, steps.len(), groups));
+    let start = profile.span("allocate", start);
+
+    let mut counters = Counters::default();
+    profile.t_stop = py.allow_threads(|| {
+        integrate(
+            &time_points,
+            y0,
+            coeff,
+            &contacts,
+            vac.view(),
+            vac_e,
+            dt,
+            stop_tol.unwrap_or(0.),
+            &mut Store::new(&steps, y.view_mut()),
+            &mut counters,
+        )
+    });
+    let start = profile.span("integrate", start);
+
+    // time points, schedules, y and t of the output, and the state, next state
+    // and infectious of integrate
+    let f64s = time_points.len()
+        + vac.len()
+        + scale.as_ref().map_or(0, |scale| scale.len())
+        + y.len()
+        + steps.len()
+        + 13 * groups;
+    profile.bytes_allocated = f64s * std::mem::size_of::<f64>()
+        + (steps.len() + active.len()) * std::mem::size_of::<usize>();
+    profile.counters = counters;
+
+    let t = steps.iter().map(|&step| time_points[step]).collect::<Array1<f64>>();
+    let (t, y) = (t.into_pyarray(py), y.into_pyarray(py));
+    profile.span("convert", start);
+    Ok((t, y, profile))
+}
+
+/// Day of a time point, robust to the rounding of the time grid.
+fn day(t: f64) -> f64 {
+    (t + 1e-9).floor()
+}
+
+/// The matrices of contact_changes and the index of the matrix active at every
+/// time step, 0 before the first change.
+fn compile_changes<'a>(
+    time_points: &Array1<f64>,
+    contact_changes: &'a Option<(Vec<f64>, PyReadonlyArray3<f64>)>,
+    groups: usize,
+) -> PyResult<(Vec<usize>, Vec<Coupling<'a>>)> {
+    let (starts, matrices) = match contact_changes {
+        Some((starts, matrices)) => (starts, matrices.as_array()),
+        None => return Ok((vec![0; time_points.len()], Vec::new())),
+    };
+    if matrices.shape() != [starts.len(), groups, groups] {
+        return Err(PyValueError::new_err(
+            "contact_changes needs one (n, n) matrix per day",
+        ));
+    }
+    if starts.iter().zip(starts.iter().skip(1)).any(|(a, b)| a > b) {
+        return Err(PyValueError::new_err("contact change days must be sorted"));
+    }
+    let active = time_points
+        .iter()
+        .map(|&t| starts.iter().filter(|&&start| start <= day(t)).count())
+        .collect();
+    let changes = (0..starts.len())
+        .map(|k| Coupling::Dense(matrices.clone().index_axis_move(Axis(0), k)))
+        .collect();
+    Ok((active, changes))
+}
+
+/// Dense (T, groups) table of the daily contact factors on the time points.
+fn compile_scale(
+    time_points: &Array1<f64>,
+    contact_scale: Option<PyReadonlyArray2<f64>>,
+    groups: usize,
+) -> PyResult<Option<Array2<f64>>> {
+    let contact_scale = match contact_scale {
+        Some(contact_scale) => contact_scale,
+        None => return Ok(None),
+    };
+    let scale = contact_scale.as_array();
+    if scale.ncols() != groups {
+        return Err(PyValueError::new_err(
+            "contact_scale must have shape (days, n)",
+        ));
+    }
+    Ok(Some(Array2::from_shape_fn(
+        (time_points.len(), groups),
+        |(t, i)| {
+            let d = day(time_points[t]);
+            if d >= 0. && (d as usize) < scale.nrows() {
+                scale[[d as usize, i]]
+            } else {
+                1.
+            }
+        },
+    )))
+}
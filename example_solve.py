@@ -9,8 +9,9 @@ from utils.mathematics import solve_SEIRD
 from utils.example_plots import cmp_age_group_sol
 from utils.example_plots import all_sol_in_grid
 
-
-solutions = solve_SEIRD((0, 100), y0_sweden, sweden_coeff, sweden_contact_matrix, 1)
+solutions = solve_SEIRD(
+    (0, 100), y0_sweden, sweden_coeff, sweden_contact_matrix, dict()
+)
 
 cmp_age_group_sol(solutions)
 all_sol_in_grid(solutions)
@@ -9,14 +9,22 @@ from dataclasses import dataclass
 
 from utils.gui import layout, layout_param, layout_stat
 from utils.icon import icon
-from utils.plots import plot_SEIRD
 from utils.example_coefficient_matrices import sweden_coefficients
 from utils.example_initial_conditions import y0_sweden
 from utils.example_contact_matrices import sweden_contact_matrix
 from utils.example_vac_params import default_vac_params
-from utils.drawing import draw_fig, delete_figure_agg, create_updated_fig_SEIRD
+from utils.default_solution import default_inputs, duration as default_duration
+from utils.scheduler import SolveScheduler
+from utils.storage import (
+    load_scenario,
+    load_scenario_xlsx,
+    save_scenario,
+    save_scenario_xlsx,
+    save_solution,
+    scenario_with_vac,
+)
+from utils.statistics import attack_rate, group_stats, ngm_R0
 from utils.validation import validate_params, validate_params_vac, validate_positive_int
-from seird_math import seird_math
 
 
 @dataclass
@@ -34,18 +42,11 @@ if platform.system() == "Windows":
         ctypes.windll.shcore.SetProcessDpiAwareness(1)
 
 
-def set_scale(scale):
-    root = sg.tk.Tk()
-    root.tk.call("tk", "scaling", scale)
-    root.destroy()
-
-
 def get_screen_size():
-    root = sg.tk.Tk()
-    root.withdraw()
-    screen_size = Screen(root.winfo_screenwidth(), root.winfo_screenheight())
-    root.destroy()
-    return screen_size
+    """Returns the screen size, measured on the hidden root PySimpleGUI keeps
+    for all of its windows
+    """
+    return Screen(*sg.Window.get_screen_size())
 
 
 if "_PYIBoot_SPLASH" in environ and importlib.util.find_spec("pyi_splash"):
@@ -59,24 +60,13 @@ else:
     icon = "icon.ico"
 
 
-# Solve SEIRD model for example data of Sweden
-t, y = seird_math.solve_seird(
-    (0, 100),
-    y0_sweden.astype(np.float64),
-    sweden_coefficients,
-    sweden_contact_matrix,
-    dict(),
-    False,
-    0.1,
-)
-
-# Create a figure from the solution
+# Show the window first, the plotting stack and the solution come after
 screen_size = get_screen_size()
-fig = plot_SEIRD(t, y, screen_size)
 
-# Scale the GUI window to the figure DPI and screen size
+# Scale the GUI window to the screen size
 if screen_size.width >= 1920:
-    set_scale(fig.dpi / 75)
+    # the figure DPI set in plots.plot_SEIRD
+    sg.set_options(scaling=100 / 75)
     font = (r"Helvetica", 12)
     font_param = (r"Helvetica", 12)
     font_stat = (r"Helvetica", 12)
@@ -99,8 +89,27 @@ window = sg.Window(
     finalize=True,
     font=font,
 )
+window.refresh()
+
+from utils.plots import SEIRDPlot
+from utils.drawing import cache_solution, draw_fig, stream_solve_SEIRD, update_fig
+from utils.default_solution import load_default_solution
+
+scheduler = SolveScheduler(window)
+
+# Show the bundled solution of the Sweden example, or solve it in the background
+# starting from the initial conditions
+default_solution = load_default_solution()
+if default_solution is not None:
+    t, y = default_solution
+    cache_solution(t, y, *default_inputs())
+else:
+    t = np.zeros(1)
+    y = np.asarray(y0_sweden, dtype=np.float64)[:, None, :]
 
 # Insert initial figure into canvas
+plot = SEIRDPlot(t, y, screen_size)
+fig = plot.fig
 fig_agg = draw_fig(window["-CANVAS-"].TKCanvas, fig, window["-TOOLBAR-"].TKCanvas)
 
 default_parameters = {
@@ -112,6 +121,13 @@ parameters = default_parameters
 vac_parameters = default_vac_params()
 
 
+scenario_file_types = (
+    ("Spreadsheet files", "*.xlsx"),
+    ("NumPy files", "*.npz"),
+    ("All files", "*.*"),
+)
+
+
 def edit_cell(window, key, row, col, justify="left"):
 
     global edit
@@ -271,9 +287,9 @@ def show_param_window():
                     no_window=True,
                     icon=icon,
                     multiple_files=False,
-                    file_types=(("Spreadsheet files", "*.xlsx"), ("All files", "*.*")),
+                    file_types=scenario_file_types,
                 )
-                save_to_disk(filename, parameters, vac_parameters)
+                save_to_disk(filename, parameters, vac_parameters, with_vac)
             except ValueError as e:
                 sg.popup_error(
                     "Invalid parameters: " + str(e),
@@ -287,7 +303,7 @@ def show_param_window():
                 icon=icon,
                 no_window=True,
                 multiple_files=False,
-                file_types=(("Spreadsheet files", "*.xlsx"), ("All files", "*.*")),
+                file_types=scenario_file_types,
             )
             try:
                 param, vac_param = load_from_disk(filename)
@@ -296,7 +312,7 @@ def show_param_window():
                     "Invalid file format"
                     + str(e)
                     + "\n"
-                    + "Please remember that this program recognizes .xlsx file format.",
+                    + "Please remember that this program recognizes .xlsx and .npz file formats.",
                     title="Invalid file format",
                     icon=icon,
                 )
@@ -304,6 +320,8 @@ def show_param_window():
             if param is not None and vac_param is not None:
                 parameters = param
                 vac_parameters = vac_param
+                if filename.lower().endswith(".npz"):
+                    with_vac = scenario_with_vac(filename)
                 window.close()
                 show_param_window()
         elif event == "-LOADDEFAULT-":
@@ -319,73 +337,14 @@ def show_param_window():
                 )
 
 
-def save_to_disk(file, parameters, vac_parameters):
+def save_to_disk(file, parameters, vac_parameters, with_vac=True):
     if file is None or file == "":
         return
-    import pandas as pd
-
-    initial_values = parameters["-INITIALTAB-"].astype(np.int64)
-    param_values = parameters["-PARAMTAB-"].astype(np.float64)
-    contact_values = parameters["-CONTACTTAB-"].astype(np.float64)
-
-    initial_values = np.insert(initial_values, 0, [i for i in range(1, 9)], axis=0)
-    initial_value_headers = ["n", "Sn", "En", "Isn", "Ian", "Rn", "Dn"]
-    initial_df = pd.DataFrame(initial_values, index=initial_value_headers)
-
-    param_values = np.insert(
-        param_values,
-        0,
-        [i for i in range(1, 9)],
-        axis=0,
-    )
-    param_headers = [
-        "n",
-        "beta",
-        "sigma",
-        "epsilon",
-        "fs",
-        "gamma_s",
-        "gamma_a",
-        "delta",
-    ]
-    param_df = pd.DataFrame(param_values, index=param_headers)
-
-    contact_values = np.insert(
-        contact_values,
-        0,
-        [i for i in range(1, 9)],
-        axis=1,
-    )
-    contact_headers = ["n", "1", "2", "3", "4", "5", "6", "7", "8"]
-    contact_df = pd.DataFrame(contact_values, columns=contact_headers)
-
-    eff_df = pd.DataFrame([[vac_parameters["eff"][0]]], columns=["eff"])
-    eff = vac_parameters.pop("eff")[0]
-
-    vac_data = []
-    vac_index = []
-    vac_columns = ["rate", "start", "end"]
-    for k, v in vac_parameters.items():
-        vac_index.append(k)
-        vac_data.append(v)
-    vac_df = pd.DataFrame(vac_data, index=vac_index, columns=vac_columns)
-    vac_parameters["eff"] = [eff]
-
     try:
-        with pd.ExcelWriter(file) as writer:
-            initial_df.to_excel(
-                writer, sheet_name="Initial values", index=True, header=False
-            )
-            param_df.to_excel(writer, sheet_name="Parameters", index=True, header=False)
-            contact_df.to_excel(
-                writer, sheet_name="Contact matrix", index=False, header=True
-            )
-            eff_df.to_excel(
-                writer, sheet_name="Vaccination efficacy", index=False, header=True
-            )
-            vac_df.to_excel(
-                writer, sheet_name="Vaccination parameters", index=True, header=True
-            )
+        if file.lower().endswith(".npz"):
+            save_scenario(file, parameters, vac_parameters, with_vac)
+        else:
+            save_scenario_xlsx(file, parameters, vac_parameters)
     except PermissionError:
         sg.popup_error(
             "The file is open in another program. Please close it and try again.",
@@ -398,21 +357,23 @@ def save_to_disk(file, parameters, vac_parameters):
 
 def load_from_disk(file):
     try:
-        if not isfile(file) or not file.lower().endswith(".xlsx"):
+        if not isfile(file) or not file.lower().endswith((".xlsx", ".npz")):
             raise FileNotFoundError
     except FileNotFoundError:
         sg.popup_error("File not found", title="Error", icon=icon)
         return None, None
 
-    import pandas as pd
+    if file.lower().endswith(".npz"):
+        try:
+            return load_scenario(file)
+        except Exception as e:
+            sg.popup_error(
+                "Invalid file format" + str(e), title="Invalid file format", icon=icon
+            )
+            return None, None
 
     try:
-        file = pd.ExcelFile(file)
-        initial = np.matrix(file.parse(0, dtype=str).iloc[:, 1:], dtype=np.int64)
-        param = np.matrix(file.parse(1, dtype=str).iloc[:, 1:], dtype=np.float64)
-        contact = np.matrix(file.parse(2, dtype=str).iloc[:, 1:], dtype=np.float64)
-        eff = file.parse(3, dtype=str).to_numpy(dtype=np.float64).flatten()
-        vac = np.matrix(file.parse(4, dtype=str).iloc[:, 1:], dtype=np.int64)
+        return load_scenario_xlsx(file)
     except PermissionError:
         sg.popup_error(
             "File is probably opened in another program. Close it and try again.",
@@ -431,19 +392,6 @@ def load_from_disk(file):
         )
         return None, None
 
-    vac_params = {"eff": [eff[0]]}
-    vac_head = [f"age_grp_{i}" for i in range(1, 9)]
-    for i in range(len(vac)):
-        vac_params[vac_head[i]] = vac[i].tolist()[0]
-
-    params = {
-        "-INITIALTAB-": initial,
-        "-PARAMTAB-": param,
-        "-CONTACTTAB-": contact,
-    }
-
-    return params, vac_params
-
 
 def load_default():
     from utils.example_initial_conditions import y0_sweden
@@ -469,8 +417,10 @@ def save_stats_to_disk(file, stats):
         "n",
         "R_n0",
         "max(I_sn)",
+        "t(max(I_sn))",
         "max(I_an)",
         "D_n(t_max)",
+        "Attack rate",
     ]
     stats_df = pd.DataFrame(stats, columns=stats_headers)
 
@@ -487,43 +437,41 @@ def save_stats_to_disk(file, stats):
         sg.popup_error("Unknown error: " + str(e), title="Unknown error", icon=icon)
 
 
-def show_stat_window():
-    global edit, y
-    edit = False
-
-    age_grp, r_n0, infectious_a, infectious_s, dead = [], [], [], [], []
-    y0 = parameters["-INITIALTAB-"]
+def compute_stats(cancel, parameters, t, y):
+    """Returns the statistics table of the solution y"""
     coeff = parameters["-PARAMTAB-"]
     contact = parameters["-CONTACTTAB-"]
+    stats = group_stats(t, y, coeff, contact)
+
+    rows = [
+        [
+            str(i + 1),
+            np.round(s["R0"], 2),
+            np.int64(s["peak_Is"]),
+            np.round(s["t_peak_Is"], 1),
+            np.int64(s["peak_Ia"]),
+            np.int64(s["deaths"]),
+            f"{s['attack_rate']:.1%}",
+        ]
+        for i, s in enumerate(stats)
+    ]
+    rows.append(
+        [
+            "All",
+            np.round(ngm_R0(y[:, 0, :], coeff, contact), 2),
+            "",
+            "",
+            "",
+            np.int64(stats["deaths"].sum()),
+            f"{attack_rate(t, y, coeff, contact):.1%}",
+        ]
+    )
+    return rows
 
-    S0 = y0[0].flat
-    beta = coeff[0].flat
-    sigma = coeff[1].flat
-    fs = coeff[3].flat
-    gamma_s = coeff[4].flat
-    gamma_a = coeff[5].flat
-    delta_n = coeff[6].flat
-
-    for i in range(8):
-        R = (
-            beta[i]
-            * sigma[i]
-            * S0[i]
-            * contact[i].sum()
-            * (fs[i] * gamma_a[i] + (1 - fs[i]) * (delta_n[i] + gamma_s[i]))
-        ) / (gamma_a[i] * (gamma_s[i] + delta_n[i]))
-        R = np.round(R, 2)
-        age_grp.append(str(int(i + 1)))
-        r_n0.append(R)
-        infectious_s.append(np.int64(max(y[2][:, i])))
-        infectious_a.append(np.int64(max(y[3][:, i])))
-        dead.append(np.int32(max(y[5][:, i])))
-    age_grp.append("")
-    r_n0.append("")
-    infectious_s.append("")
-    infectious_a.append("Sum:")
-    dead.append(sum(dead))
-    stats = np.array([age_grp, r_n0, infectious_s, infectious_a, dead]).T
+
+def show_stat_window(stats):
+    global edit
+    edit = False
 
     window = sg.Window(
         title="Statistics",
@@ -558,89 +506,138 @@ def show_stat_window():
                 )
 
 
+def vaccination_message(t, y, vac_parameters, vac_E):
+    """Returns the days on which the age groups got fully vaccinated, the
+    first of the group's campaigns to empty it
+    """
+    msg = ""
+    for k, v in vac_parameters.items():
+        if k == "eff":
+            continue
+        group = int(k[-1]) - 1
+        campaigns = sorted(zip(v[0::3], v[1::3], v[2::3]), key=lambda c: c[1])
+        for rate, start, end in campaigns:
+            if not rate:
+                continue
+            days = slice(np.searchsorted(t, start), np.searchsorted(t, end))
+            if vac_E:
+                indexes_e = np.where(y[1, days, group] < 1)
+                indexes_s = np.where(y[0, days, group] < 1)
+                if not (indexes_s[0].size and indexes_e[0].size):
+                    continue
+                first_zero = (
+                    t[indexes_e[0][0]]
+                    if indexes_s[0][0] == indexes_e[0][0]
+                    else t[indexes_s[0][0]]
+                )
+            else:
+                indexes = np.where(y[0, days, group] < rate * vac_parameters["eff"][0])
+                if not indexes[0].size:
+                    continue
+                first_zero = t[indexes[0][0]]
+            msg += (
+                f"Age group {k[-1]} fully vaccinated on day: {int(first_zero+start)}\n"
+            )
+            break
+    return msg
+
+
+def start_solve(duration, params_vac=None, vac_E=True):
+    """Starts solving in the background, dropping the solve still running"""
+    global solve_vac
+    solve_vac = None if params_vac is None else (params_vac, vac_E)
+    scheduler.submit(
+        "SOLVE",
+        stream_solve_SEIRD,
+        window,
+        duration,
+        parameters,
+        params_vac or dict(),
+        vac_E,
+    )
+    window["-CANCEL-"].update(disabled=False)
+
+
+solve_vac = None
+if default_solution is None:
+    start_solve(default_duration, vac_E=False)
+
+
 # Main loop
 while True:
     event, values = window.read()
     if event in (None, "Exit"):
+        scheduler.shutdown()
         window.close()
         break
     elif event == "-PARAM-":
         show_param_window()
     elif event == "-STAT-":
-        show_stat_window()
+        scheduler.submit("STAT", compute_stats, parameters, t, y)
+    elif event == "-SAVESOL-":
+        filename = sg.popup_get_file(
+            "Save solution to file",
+            save_as=True,
+            no_window=True,
+            icon=icon,
+            multiple_files=False,
+            file_types=(("NumPy files", "*.npz"), ("All files", "*.*")),
+        )
+        if filename:
+            try:
+                save_solution(filename, t, y)
+            except PermissionError:
+                sg.popup_error(
+                    "The file is open in another program. Please close it and try again.",
+                    title="File open",
+                    icon=icon,
+                )
+    elif event == "-STAT-DONE-":
+        show_stat_window(values[event][1])
+    elif event == "-STAT-ERROR-":
+        sg.popup_error(
+            "Invalid parameters: " + str(values[event][1]),
+            title="Invalid parameters",
+            icon=icon,
+        )
     elif event == "-DRAW-" and with_vac:
-        delete_figure_agg(fig_agg)
         try:
             validate_params(parameters)
             validate_params_vac(vac_parameters)
             validate_positive_int(values["-DURATION-"], "Duration")
-            fig, t, y = create_updated_fig_SEIRD(
-                int(values["-DURATION-"]),
-                parameters,
-                vac_parameters,
-                screen_size,
-                vac_E,
-            )
-            fig_agg = draw_fig(
-                window["-CANVAS-"].TKCanvas, fig, window["-TOOLBAR-"].TKCanvas
-            )
-            msg = ""
-            for k, v in vac_parameters.items():
-                if k != "eff" and vac_E and v[0]:
-                    indexes_e = np.where(
-                        y[
-                            1,
-                            np.searchsorted(t, v[1]) : np.searchsorted(t, v[2]),
-                            int(k[-1]) - 1,
-                        ]
-                        < 1
-                    )
-                    indexes_s = np.where(
-                        y[
-                            0,
-                            np.searchsorted(t, v[1]) : np.searchsorted(t, v[2]),
-                            int(k[-1]) - 1,
-                        ]
-                        < 1
-                    )
-                    if indexes_s[0].size and indexes_e[0].size:
-                        first_zero = (
-                            t[indexes_e[0][0]]
-                            if indexes_s[0][0] == indexes_e[0][0]
-                            else t[indexes_s[0][0]]
-                        )
-                        msg += f"Age group {k[-1]} fully vaccinated on day: {int(first_zero+v[1])}\n"
-                elif k != "eff" and not vac_E and v[0]:
-                    indexes = np.where(
-                        y[
-                            0,
-                            np.searchsorted(t, v[1]) : np.searchsorted(t, v[2]),
-                            int(k[-1]) - 1,
-                        ]
-                        < v[0] * vac_parameters["eff"][0]
-                    )
-                    if indexes[0].size:
-                        first_zero = t[indexes[0][0]]
-                        msg += f"Age group {k[-1]} fully vaccinated on day: {int(first_zero+v[1])}\n"
-            if msg:
-                sg.popup_ok(msg, title="Vaccination", icon=icon)
+            start_solve(int(values["-DURATION-"]), vac_parameters, vac_E)
         except ValueError as e:
             sg.popup_error(
                 "Invalid parameters: " + str(e), title="Invalid parameters", icon=icon
             )
 
     elif event == "-DRAW-":
-        delete_figure_agg(fig_agg)
         try:
             validate_params(parameters)
             validate_positive_int(values["-DURATION-"], "Duration")
-            fig, t, y = create_updated_fig_SEIRD(
-                int(values["-DURATION-"]), parameters, screen_size=screen_size
-            )
-            fig_agg = draw_fig(
-                window["-CANVAS-"].TKCanvas, fig, window["-TOOLBAR-"].TKCanvas
-            )
+            start_solve(int(values["-DURATION-"]))
         except ValueError as e:
             sg.popup_error(
                 "Invalid parameters: " + str(e), title="Invalid parameters", icon=icon
             )
+    elif event == "-CANCEL-":
+        scheduler.cancel("SOLVE")
+        window["-CANCEL-"].update(disabled=True)
+    elif event == "-SOLVE-CHUNK-":
+        cancel, t_part, y_part = values[event]
+        if scheduler.is_current("SOLVE", cancel):
+            plot.update(t_part, y_part)
+            fig_agg.draw_idle()
+    elif event == "-SOLVE-DONE-":
+        cancel, solution = values[event]
+        if scheduler.is_current("SOLVE", cancel):
+            t, y = solution
+            update_fig(fig_agg, plot, t, y)
+            window["-CANCEL-"].update(disabled=True)
+            if solve_vac is not None:
+                msg = vaccination_message(t, y, *solve_vac)
+                if msg:
+                    sg.popup_ok(msg, title="Vaccination", icon=icon)
+    elif event == "-SOLVE-ERROR-":
+        window["-CANCEL-"].update(disabled=True)
+        sg.popup_error("Solving failed: " + str(values[event][1]), icon=icon)
@@ -0,0 +1,43 @@
+"""Checks every solver backend against the committed golden solutions, see
+utils.regression. The Rust backends are skipped without seird_math.
+"""
+
+import importlib.util
+from os.path import dirname, join
+
+import numpy as np
+import pytest
+
+from utils.regression import backends, bounded, check_golden, corpus, load_golden
+
+golden = join(dirname(__file__), "golden.npz")
+
+
+@pytest.mark.parametrize("backend", list(backends))
+def test_backend_matches_golden(backend):
+    if backend.startswith("rust") and importlib.util.find_spec("seird_math") is None:
+        pytest.skip("seird_math is not installed")
+    results = check_golden(golden, [backend])
+    assert results
+    assert [r for r in results if not r["ok"]] == []
+
+
+def test_golden_is_bounded():
+    _, solutions, _ = load_golden(golden)
+    assert [name for (name, _), (_, y) in solutions.items() if not bounded(y)] == []
+
+
+def test_golden_inputs_match_corpus():
+    scenarios, _, _ = load_golden(golden)
+    expected = corpus()
+    assert list(scenarios) == list(expected)
+    for name, s in scenarios.items():
+        assert s.coeff == pytest.approx(expected[name].coeff, rel=1e-12), name
+        assert s.params_vac == expected[name].params_vac, name
+        assert s.vac_E == expected[name].vac_E, name
+
+
+def test_blow_up_is_not_bounded():
+    y = np.ones((6, 3, 8))
+    y[2, -1] = 1e179
+    assert not bounded(y)
@@ -0,0 +1,301 @@
+"""Times the solvers, the figure rendering and the scenario files, and writes
+the results as JSON so the runs of two builds can be compared.
+
+    python -m utils.benchmark -o bench.json
+    python -m utils.benchmark --only solve --horizons 100 365 --repeat 3
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+from importlib import metadata
+from os.path import dirname, join
+from types import SimpleNamespace
+
+import numpy as np
+
+from .example_coefficient_matrices import sweden_coefficients
+from .example_contact_matrices import sweden_contact_matrix
+from .example_initial_conditions import y0_sweden
+from .example_vac_params import default_vac_params
+from .mathematics import solve_SEIRD, solve_SEIRD_vectorized
+from .storage import (
+    load_scenario,
+    load_scenario_xlsx,
+    load_solution,
+    save_scenario,
+    save_scenario_xlsx,
+    save_solution,
+)
+
+groups = ["solve", "render", "io"]
+
+# Full HD, the figure size of plot_SEIRD without rescaling
+screen_size = SimpleNamespace(width=1920, height=1080)
+
+
+def _inputs(vaccinated):
+    params_vac = default_vac_params() if vaccinated else dict()
+    return (
+        y0_sweden.astype(np.float64),
+        sweden_coefficients,
+        sweden_contact_matrix,
+        params_vac,
+    )
+
+
+def measure(fn, repeat=5, warmup=1):
+    """Calls fn warmup + repeat times and returns the timings of the repeats
+
+    Returns:
+        timing (dict): min, median, mean and max in seconds and every run
+    """
+    for _ in range(warmup):
+        fn()
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - start)
+    return {
+        "min": min(runs),
+        "median": statistics.median(runs),
+        "mean": statistics.fmean(runs),
+        "max": max(runs),
+        "runs": runs,
+    }
+
+
+def solve_cases(horizons, dts):
+    """Yields (name, parameters, fn) for every solver configuration
+
+    The Python engines have a fixed daily step, only the Rust solver runs
+    every dt. Without seird_math its cases are marked as skipped.
+    """
+    rust = _rust()
+    for horizon in horizons:
+        for vaccinated in (False, True):
+            for vac_E in (False, True):
+                y0, coeff, contact, params_vac = _inputs(vaccinated)
+                case = {"horizon": horizon, "vaccinated": vaccinated, "vac_E": vac_E}
+                for engine in ("loop", "vectorized"):
+                    yield f"solve/python-{engine}", dict(
+                        case, backend=f"python-{engine}", dt=1
+                    ), lambda: solve_SEIRD(
+                        (0, horizon), y0, coeff, contact, params_vac, vac_E, engine
+                    )
+                for dt in dts:
+                    params = dict(case, backend="rust", dt=dt)
+                    if rust is None:
+                        params["skipped"] = "seird_math not installed"
+                        yield "solve/rust", params, None
+                        continue
+                    yield "solve/rust", params, lambda: rust.solve_seird(
+                        (0, horizon), y0, coeff, contact, params_vac, vac_E, dt
+                    )
+
+
+def _rust():
+    """The seird_math module, None when it is not installed"""
+    try:
+        from seird_math import seird_math
+    except ImportError:
+        return None
+    return seird_math
+
+
+def _solution(horizon=100):
+    """The unvaccinated example at the dt of the GUI, where it stays bounded"""
+    y0, coeff, contact, params_vac = _inputs(False)
+    s = solve_SEIRD_vectorized(
+        (0, horizon), y0, coeff, contact, params_vac, False, dt=0.1
+    )
+    return s.t, s.y
+
+
+def _tk_root():
+    """A hidden Tk root, None without a display"""
+    import tkinter
+
+    try:
+        root = tkinter.Tk()
+    except tkinter.TclError:
+        return None
+    root.withdraw()
+    return root
+
+
+def render_cases(horizons):
+    """Yields the figure cases: building plot_SEIRD, rendering it with Agg,
+    updating the lines of SEIRDPlot and, with a display, draw_fig in Tk
+    """
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    from .plots import SEIRDPlot, plot_SEIRD
+
+    def plot(t, y):
+        plt.close(plot_SEIRD(t, y, screen_size))
+
+    def render(t, y):
+        fig = plot_SEIRD(t, y, screen_size)
+        fig.canvas.draw()
+        plt.close(fig)
+
+    for horizon in horizons:
+        t, y = _solution(horizon)
+        case = {"horizon": horizon}
+        yield "render/plot_SEIRD", case, lambda: plot(t, y)
+        yield "render/plot_SEIRD+agg", case, lambda: render(t, y)
+
+        figure = SEIRDPlot(t, y, screen_size)
+
+        def update():
+            figure.update(t, y)
+            figure.fig.canvas.draw()
+
+        yield "render/SEIRDPlot.update+agg", case, update
+
+    root = _tk_root()
+    if root is None:
+        yield "render/draw_fig", {"skipped": "no display"}, None
+        return
+    import tkinter
+
+    from .drawing import draw_fig
+
+    canvas, toolbar_frame = tkinter.Canvas(root), tkinter.Frame(root)
+    for horizon in horizons:
+        t, y = _solution(horizon)
+
+        def draw():
+            fig = plot_SEIRD(t, y, screen_size)
+            draw_fig(canvas, fig, toolbar_frame).draw()
+            root.update_idletasks()
+            plt.close(fig)
+
+        yield "render/draw_fig", {"horizon": horizon}, draw
+
+
+def io_cases(directory):
+    """Yields the scenario and solution file cases"""
+    y0, coeff, contact, params_vac = _inputs(True)
+    params = {
+        "-INITIALTAB-": np.matrix(y0_sweden, dtype=np.int64),
+        "-PARAMTAB-": np.matrix(coeff, dtype=np.float64),
+        "-CONTACTTAB-": np.matrix(contact, dtype=np.float64),
+    }
+    xlsx, npz = join(directory, "scenario.xlsx"), join(directory, "scenario.npz")
+    yield "io/save_scenario_xlsx", {}, lambda: save_scenario_xlsx(
+        xlsx, params, params_vac
+    )
+    yield "io/load_scenario_xlsx", {}, lambda: load_scenario_xlsx(xlsx)
+    yield "io/save_scenario", {}, lambda: save_scenario(npz, params, params_vac)
+    yield "io/load_scenario", {}, lambda: load_scenario(npz)
+
+    t, y = _solution(1000)
+    solution = join(directory, "solution.npz")
+    yield "io/save_solution", {"horizon": 1000}, lambda: save_solution(solution, t, y)
+    for mmap in (False, True):
+        yield "io/load_solution", {"horizon": 1000, "mmap": mmap}, lambda: np.asarray(
+            load_solution(solution, mmap)[1]
+        )
+
+
+def environment():
+    """Versions and machine the results were measured with"""
+
+    def version(package):
+        try:
+            return metadata.version(package)
+        except metadata.PackageNotFoundError:
+            return None
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=dirname(dirname(__file__)),
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "time": datetime.now(timezone.utc).isoformat(),
+        "commit": commit or None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "packages": {
+            p: version(p) for p in ("SEIRD_math_rs", "numpy", "matplotlib", "pandas")
+        },
+    }
+
+
+def run(only=groups, horizons=(100, 365, 1000), dts=(0.1, 0.5, 1.0), repeat=5):
+    """Runs the benchmark groups in only, a case that fails is recorded with its
+    error instead of a timing
+
+    Returns:
+        results (list): One dict per case with its name, parameters and timing
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        cases = {
+            "solve": lambda: solve_cases(horizons, dts),
+            "render": lambda: render_cases(horizons),
+            "io": lambda: io_cases(directory),
+        }
+        for group in only:
+            for name, params, fn in cases[group]():
+                result = {"name": name, "params": params}
+                if fn is not None:
+                    try:
+                        result["timing"] = measure(fn, repeat)
+                    except Exception as e:
+                        result["error"] = f"{type(e).__name__}: {e}"
+                results.append(result)
+                print(_summary(result), flush=True)
+    return results
+
+
+def _summary(result):
+    params = " ".join(f"{k}={v}" for k, v in result["params"].items())
+    if "timing" in result:
+        outcome = f"{result['timing']['median'] * 1e3:10.2f} ms"
+    else:
+        outcome = f"{'failed' if 'error' in result else 'skipped':>13}"
+    return f"{outcome}  {result['name']} {params}"
+
+
+def parser():
+    p = argparse.ArgumentParser(
+        prog="python -m utils.benchmark",
+        description="Time the solvers, the figure and the scenario files.",
+    )
+    p.add_argument("-o", "--output", default="benchmark.json", help="JSON results")
+    p.add_argument("--only", nargs="+", choices=groups, default=groups)
+    p.add_argument("--horizons", nargs="+", type=int, default=[100, 365, 1000])
+    p.add_argument("--dt", nargs="+", type=float, default=[0.1, 0.5, 1.0])
+    p.add_argument("--repeat", type=int, default=5, help="Timed runs per case")
+    return p
+
+
+def main(argv=None):
+    args = parser().parse_args(argv)
+    results = run(args.only, args.horizons, args.dt, args.repeat)
+    with open(args.output, "w") as f:
+        json.dump({"environment": environment(), "results": results}, f, indent=2)
+    print(f"{len(results)} cases written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def _update(h, value):
+    """Feeds a solver input into the hash, recursing into containers."""
+    if isinstance(value, np.ndarray):
+        value = np.ascontiguousarray(value)
+        h.update(f"{value.dtype.str}{value.shape}".encode())
+        h.update(value.tobytes())
+    elif isinstance(value, dict):
+        h.update(b"{")
+        for k in sorted(value, key=str):
+            _update(h, k)
+            _update(h, value[k])
+        h.update(b"}")
+    elif isinstance(value, (list, tuple)):
+        h.update(b"[")
+        for v in value:
+            _update(h, v)
+        h.update(b"]")
+    else:
+        h.update(repr(value).encode())
+
+
+def solution_key(*inputs):
+    """Content hash of everything a solve depends on."""
+    h = hashlib.blake2b(digest_size=16)
+    for value in inputs:
+        _update(h, value)
+    return h.hexdigest()
+
+
+class SolutionCache:
+    """LRU cache of (t, y) solutions bounded by the memory of the arrays.
+
+    Stored arrays are made read-only, so a caller can't corrupt an entry that
+    is handed out again later. Solves on different worker threads may share
+    one cache, every method takes a lock.
+    """
+
+    def __init__(self, max_bytes=256 * 2**20):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, t, y):
+        with self._lock:
+            if key in self._entries:
+                old_t, old_y = self._entries.pop(key)
+                self.nbytes -= old_t.nbytes + old_y.nbytes
+            size = t.nbytes + y.nbytes
+            if size > self.max_bytes:
+                return
+            t.flags.writeable = False
+            y.flags.writeable = False
+            self._entries[key] = (t, y)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, (old_t, old_y) = self._entries.popitem(last=False)
+                self.nbytes -= old_t.nbytes + old_y.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
@@ -0,0 +1,351 @@
+"""Fits rows of the coefficient matrix to observed daily deaths or cases.
+
+A population of candidates is evaluated in one batched solve, spread over
+every core by seird_math.solve_seird_batch, so population-based optimizers
+such as differential evolution (built in, see Calibration.fit) or CMA-ES
+cost one solver call per generation:
+
+    seird-calibrate scenario.npz deaths.csv --params beta delta -o fitted.npz
+
+The CSV has a "day" column and either one column per age group ("1" to "8")
+or a single "total" column. Empty cells are missing observations.
+"""
+
+import argparse
+from dataclasses import dataclass
+
+import numpy as np
+
+from .scenarios import group_columns, param_names
+from .statistics import cumulative_incidence
+
+series_names = ["deaths", "cases"]
+loss_names = ["poisson", "sse"]
+
+
+@dataclass
+class calibration_result:
+    # best candidate and the coefficients of shape (7, n) it stands for
+    x: np.ndarray
+    coeff: np.ndarray
+    loss: float
+    # best loss after every generation
+    history: np.ndarray
+    evaluations: int
+
+
+class Calibration:
+    """The loss of candidate coefficients against an observed daily series
+
+    A candidate is a vector with one value per calibrated row of coeff, the
+    same for every age group, or with per_group one value per row and age
+    group, row by row. Its rows replace those of coeff.
+
+    Args:
+        y0 (np.ndarray): Initial values of shape (6, n)
+        coeff (np.ndarray): Coefficients of shape (7, n), the rows not
+            calibrated are kept
+        contact (np.ndarray): Contact matrix of shape (n, n)
+        observed (np.ndarray): New deaths or cases on the days t_obs, of shape
+            (len(t_obs), n) per age group or (len(t_obs),) for the whole
+            population. NaN marks a missing observation.
+        t_obs (np.ndarray): Whole days of the observations, 1, 2, ... when None
+        params (list): Names of the calibrated rows, see scenarios.param_names
+        per_group (bool): Calibrate every age group separately
+        bounds (dict): (low, high) by row name, by default 0 up to ten times
+            the largest value of the row in coeff, at most 1 apart from beta
+        series (str): "deaths" or "cases" (new infections)
+        loss (str): "poisson" negative log-likelihood or "sse"
+        workers (int): Solver threads, 0 uses every core
+        engine (str): "rust" for seird_math or "vectorized" for the Python
+            batch solver (daily step)
+    """
+
+    def __init__(
+        self,
+        y0,
+        coeff,
+        contact,
+        observed,
+        t_obs=None,
+        params=("beta",),
+        per_group=False,
+        bounds=None,
+        series="deaths",
+        params_vac=dict(),
+        vac_E=True,
+        loss="poisson",
+        dt=0.1,
+        workers=0,
+        engine="rust",
+    ):
+        unknown = [p for p in params if p not in param_names]
+        if unknown:
+            raise ValueError(f"Unknown parameters: {', '.join(unknown)}")
+        if series not in series_names:
+            raise ValueError(f"Unknown series: {series}")
+        if loss not in loss_names:
+            raise ValueError(f"Unknown loss: {loss}")
+
+        self.y0 = np.asarray(y0, dtype=np.float64)
+        self.coeff = np.asarray(coeff, dtype=np.float64)
+        self.contact = np.asarray(contact, dtype=np.float64)
+        self.observed = np.asarray(observed, dtype=np.float64)
+        n_obs = len(self.observed)
+        self.t_obs = np.arange(1, n_obs + 1) if t_obs is None else np.asarray(t_obs)
+        if len(self.t_obs) != n_obs or np.any(self.t_obs < 1):
+            raise ValueError("Observations need one day >= 1 each.")
+        self.t_obs = self.t_obs.astype(np.int64)
+
+        self.rows = [param_names.index(p) for p in params]
+        self.per_group = per_group
+        self.series, self.loss_name = series, loss
+        self.params_vac, self.vac_E = params_vac, vac_E
+        self.dt, self.workers, self.engine = dt, workers, engine
+        self.evaluations = 0
+
+        # 0 up to ten times the starting values, at most 1 apart from beta
+        high = 10 * self.coeff.max(axis=-1)
+        high[1:] = np.fmin(high[1:], 1)
+        bounds = dict(bounds or {})
+        bounds = {p: bounds.get(p, (0, high[i])) for p, i in zip(params, self.rows)}
+        width = self.coeff.shape[-1] if per_group else 1
+        self.bounds = np.array(
+            [bounds[p] for p in params for _ in range(width)], dtype=np.float64
+        )
+
+    @property
+    def x0(self):
+        """The candidate of coeff, the row means without per_group"""
+        rows = self.coeff[self.rows]
+        if not self.per_group:
+            rows = rows.mean(axis=-1, keepdims=True)
+        return rows.ravel()
+
+    def coefficients(self, X):
+        """Coefficients of shape (N, 7, n) of the candidates X of shape (N, d)"""
+        X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+        n_groups = self.coeff.shape[-1]
+        coeff = np.repeat(self.coeff[None], len(X), axis=0)
+        rows = X.reshape(len(X), len(self.rows), -1)
+        coeff[:, self.rows, :] = np.broadcast_to(
+            rows, (len(X), len(self.rows), n_groups)
+        )
+        return coeff
+
+    def _solve(self, coeff, t_out):
+        N = len(coeff)
+        y0 = np.ascontiguousarray(np.broadcast_to(self.y0, (N, *self.y0.shape)))
+        t_range = (0, int(t_out[-1]))
+        if self.engine == "vectorized":
+            from .mathematics import solve_SEIRD_batch
+
+            s = solve_SEIRD_batch(
+                t_range, y0, coeff, self.contact, self.params_vac, self.vac_E
+            )
+            return s.t[t_out], s.y[..., t_out, :]
+        from seird_math import seird_math
+
+        return seird_math.solve_seird_batch(
+            t_range,
+            y0,
+            coeff,
+            self.contact,
+            self.params_vac,
+            self.vac_E,
+            self.dt,
+            self.workers,
+            t_out.astype(np.float64),
+        )
+
+    def simulate(self, X):
+        """The series predicted by the candidates X of shape (N, d), with the
+        shape of observed after the leading N
+        """
+        coeff = self.coefficients(X)
+        t_out = np.arange(self.t_obs.max() + 1)
+        t, y = self._solve(coeff, t_out)
+        if self.series == "deaths":
+            total = y[:, 5]
+        else:
+            total = cumulative_incidence(t, y, coeff, self.contact)
+        daily = np.diff(total, axis=-2)[:, self.t_obs - 1, :]
+        self.evaluations += len(coeff)
+        if self.observed.ndim == 1:
+            return daily.sum(axis=-1)
+        return daily
+
+    def objective(self, X):
+        """Loss of every candidate of X of shape (N, d), inf where the solve
+        is not finite
+        """
+        predicted = self.simulate(X)
+        observed = np.nan_to_num(self.observed)
+        missing = np.isnan(self.observed)
+        if self.loss_name == "sse":
+            terms = (predicted - observed) ** 2
+        else:
+            predicted = np.fmax(predicted, 1e-9)
+            terms = predicted - observed * np.log(predicted)
+        terms = np.where(missing, 0, terms)
+        loss = terms.reshape(len(terms), -1).sum(axis=-1)
+        return np.where(np.isfinite(loss), loss, np.inf)
+
+    def fit(
+        self,
+        popsize=32,
+        generations=200,
+        mutation=0.7,
+        crossover=0.9,
+        seed=0,
+        tol=1e-8,
+        callback=None,
+    ):
+        """Minimizes the loss with differential evolution (rand/1/bin) within
+        the bounds, one batched solve of the whole population per generation
+
+        Args:
+            popsize (int): Candidates per generation, at least 4
+            tol (float): Stops once the losses of the population spread less
+                than tol times their mean
+            callback: Called with the generation, the best candidate and its
+                loss after every generation, stops the fit when it returns True
+
+        Returns:
+            calibration_result: The best candidate found
+        """
+        if popsize < 4:
+            raise ValueError("Differential evolution needs at least 4 candidates.")
+        rng = np.random.default_rng(seed)
+        low, high = self.bounds.T
+        d = len(low)
+        population = low + rng.random((popsize, d)) * (high - low)
+        population[0] = np.clip(self.x0, low, high)
+        losses = self.objective(population)
+        history = [losses.min()]
+
+        others = np.array([np.delete(np.arange(popsize), i) for i in range(popsize)])
+        for generation in range(generations):
+            # three distinct candidates other than the target for every target
+            picks = rng.random(others.shape).argsort(axis=1)[:, :3]
+            a, b, c = np.take_along_axis(others, picks, axis=1).T
+            mutant = population[a] + mutation * (population[b] - population[c])
+            mutant = np.clip(mutant, low, high)
+            cross = rng.random((popsize, d)) < crossover
+            cross[np.arange(popsize), rng.integers(d, size=popsize)] = True
+            trial = np.where(cross, mutant, population)
+
+            trial_losses = self.objective(trial)
+            better = trial_losses <= losses
+            population[better], losses[better] = trial[better], trial_losses[better]
+            best = losses.argmin()
+            history.append(losses[best])
+            if callback is not None and callback(
+                generation, population[best], losses[best]
+            ):
+                break
+            if np.isfinite(losses).all() and np.std(losses) <= tol * abs(
+                np.mean(losses)
+            ):
+                break
+
+        best = losses.argmin()
+        return calibration_result(
+            population[best],
+            self.coefficients(population[best])[0],
+            float(losses[best]),
+            np.array(history),
+            self.evaluations,
+        )
+
+
+def read_observed(file):
+    """Reads the days and the observed series of a CSV file, see the module
+    docstring
+
+    Returns:
+        t_obs, observed: Days and values of shape (days, 8) or (days,)
+    """
+    import pandas as pd
+
+    frame = pd.read_csv(file)
+    if "day" not in frame:
+        raise ValueError('The observations need a "day" column.')
+    columns = ["total"] if "total" in frame else group_columns
+    missing = [c for c in columns if c not in frame]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+    observed = frame[columns].to_numpy(dtype=np.float64)
+    if columns == ["total"]:
+        observed = observed[:, 0]
+    return frame["day"].to_numpy(dtype=np.int64), observed
+
+
+def parser():
+    p = argparse.ArgumentParser(
+        prog="seird-calibrate",
+        description="Fit SEIRD parameters to observed daily deaths or cases.",
+    )
+    p.add_argument("scenario", help="An .npz scenario with the starting values")
+    p.add_argument("observed", help='CSV with "day" and "1".."8" or "total"')
+    p.add_argument("-o", "--output", default="fitted.npz", help="Fitted scenario")
+    p.add_argument("--params", nargs="+", default=["beta"], choices=param_names)
+    p.add_argument(
+        "--per-group", action="store_true", help="Fit every age group separately"
+    )
+    p.add_argument("--series", default="deaths", choices=series_names)
+    p.add_argument("--loss", default="poisson", choices=loss_names)
+    p.add_argument("--popsize", type=int, default=32)
+    p.add_argument("--generations", type=int, default=200)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--dt", type=float, default=0.1, help="Solver time step")
+    p.add_argument(
+        "--workers", type=int, default=0, help="Solver threads, 0 uses every core"
+    )
+    p.add_argument(
+        "--no-vac-E",
+        dest="vac_E",
+        action="store_false",
+        help="Vaccinate only the S group",
+    )
+    return p
+
+
+def main(argv=None):
+    from .storage import load_scenario, save_scenario, scenario_with_vac
+
+    args = parser().parse_args(argv)
+    params, params_vac = load_scenario(args.scenario)
+    with_vac = scenario_with_vac(args.scenario)
+    t_obs, observed = read_observed(args.observed)
+    calibration = Calibration(
+        params["-INITIALTAB-"],
+        params["-PARAMTAB-"],
+        params["-CONTACTTAB-"],
+        observed,
+        t_obs,
+        args.params,
+        args.per_group,
+        series=args.series,
+        params_vac=params_vac if with_vac else dict(),
+        vac_E=args.vac_E,
+        loss=args.loss,
+        dt=args.dt,
+        workers=args.workers,
+    )
+
+    def report(generation, x, loss):
+        print(f"generation {generation + 1}: loss {loss:.6g}", flush=True)
+
+    result = calibration.fit(
+        args.popsize, args.generations, seed=args.seed, callback=report
+    )
+    params["-PARAMTAB-"] = np.matrix(result.coeff, dtype=np.float64)
+    save_scenario(args.output, params, params_vac, with_vac)
+    for name, row in zip(args.params, result.x.reshape(len(args.params), -1)):
+        print(f"{name}: {' '.join(f'{v:.6g}' for v in row)}")
+    print(f"{result.evaluations} solves, fitted scenario written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""Headless batch runner: solves scenario files and writes solutions and
+statistics, without importing PySimpleGUI or matplotlib.
+
+    seird-batch scenarios.csv other.npz -o results --workers 8 --output-every 1
+"""
+
+import argparse
+import csv
+import sys
+from os import makedirs
+from os.path import basename, join, splitext
+
+import numpy as np
+
+from .mathematics import solve_SEIRD_batch
+from .scenarios import read_scenarios
+from .statistics import group_stats, ngm_R0, stats_dtype
+from .storage import load_scenario, save_solution, scenario_with_vac
+from .validation import validate_params_batch, validate_params_vac
+
+
+def _read(file, chunk_size):
+    """Returns the vaccination parameters of a scenario file and an iterator
+    over its chunks of (ids, y0, coeff, contact). A scenario saved without
+    vaccination keeps its campaigns, but none apply.
+    """
+    if file.lower().endswith(".npz"):
+        params, params_vac = load_scenario(file)
+        if not scenario_with_vac(file):
+            params_vac = dict()
+        y0 = np.asarray(params["-INITIALTAB-"], dtype=np.float64)[None]
+        coeff = np.asarray(params["-PARAMTAB-"])[None]
+        contact = np.asarray(params["-CONTACTTAB-"])[None]
+        ids = np.array([splitext(basename(file))[0]])
+        validate_params_batch(y0, coeff, contact, ids)
+        return params_vac, iter([(ids, y0, coeff, contact)])
+    return dict(), read_scenarios(file, chunk_size)
+
+
+def _solve_python(time_range, y0, coeff, contact, params_vac, vac_E, dt, workers):
+    """solve_seird_batch of seird_math on the vectorized Python engine, which
+    runs on a single core
+    """
+    sol = solve_SEIRD_batch(time_range, y0, coeff, contact, params_vac, vac_E, dt=dt)
+    return sol.t, sol.y
+
+
+def _solver():
+    """seird_math.solve_seird_batch, or the slower Python engine when the
+    extension is not installed
+    """
+    try:
+        from seird_math import seird_math
+    except ImportError:
+        print(
+            "seird_math is not installed, solving with the Python engine",
+            file=sys.stderr,
+        )
+        return _solve_python
+    return seird_math.solve_seird_batch
+
+
+def _output_steps(t, t_out):
+    """Indices of the time points nearest to the days in t_out"""
+    return np.abs(t[:, None] - t_out[None, :]).argmin(axis=0)
+
+
+def _stats_rows(ids, t, y, coeff, contact):
+    stats = group_stats(t, y, coeff, contact)
+    R0 = ngm_R0(y[:, :, 0, :], coeff, contact)
+    for i, scenario in enumerate(ids):
+        for group, record in enumerate(stats[i], start=1):
+            yield [scenario, group, R0[i], *record.tolist()]
+
+
+def parser():
+    p = argparse.ArgumentParser(
+        prog="seird-batch", description="Solve SEIRD scenarios without the GUI."
+    )
+    p.add_argument(
+        "scenarios", nargs="+", help="Scenario files: .npz, .csv or .parquet"
+    )
+    p.add_argument("-o", "--output", default=".", help="Output directory")
+    p.add_argument("--duration", type=int, default=100, help="Days to simulate")
+    p.add_argument("--dt", type=float, default=0.1, help="Solver time step")
+    p.add_argument(
+        "--workers", type=int, default=0, help="Solver threads, 0 uses every core"
+    )
+    p.add_argument(
+        "--output-every",
+        type=float,
+        default=None,
+        help="Days between stored time points, every step when omitted. The "
+        "statistics always use every step.",
+    )
+    p.add_argument(
+        "--stats-only",
+        action="store_true",
+        help="Write only the statistics, not the solutions",
+    )
+    p.add_argument(
+        "--vaccination",
+        default=None,
+        help="An .npz scenario whose vaccination parameters apply to every scenario",
+    )
+    p.add_argument(
+        "--no-vac-E",
+        dest="vac_E",
+        action="store_false",
+        help="Vaccinate only the S group",
+    )
+    p.add_argument(
+        "--chunk-size",
+        type=int,
+        default=1024,
+        help="Scenarios per batched solve, each holds its full solution in memory",
+    )
+    return p
+
+
+def main(argv=None):
+    args = parser().parse_args(argv)
+    solve = _solver()
+
+    makedirs(args.output, exist_ok=True)
+    t_out = None
+    if args.output_every:
+        t_out = np.arange(0, args.duration + args.dt / 2, args.output_every)
+
+    for file in args.scenarios:
+        stem = splitext(basename(file))[0]
+        params_vac, chunks = _read(file, args.chunk_size)
+        if args.vaccination:
+            params_vac = load_scenario(args.vaccination)[1]
+        if params_vac:
+            validate_params_vac(params_vac)
+
+        n = 0
+        with open(join(args.output, f"{stem}_stats.csv"), "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["scenario", "group", "R0_population", *stats_dtype.names])
+            for k, (ids, y0, coeff, contact) in enumerate(chunks):
+                # the peaks and the incidence need every step, t_out only
+                # thins out the stored solution
+                t, y = solve(
+                    (0, args.duration),
+                    y0,
+                    coeff,
+                    contact,
+                    params_vac,
+                    args.vac_E,
+                    args.dt,
+                    args.workers,
+                )
+                writer.writerows(_stats_rows(ids, t, y, coeff, contact))
+                if not args.stats_only:
+                    if t_out is not None:
+                        steps = _output_steps(t, t_out)
+                        t, y = t[steps], y[..., steps, :]
+                    save_solution(
+                        join(args.output, f"{stem}_{k:04d}.npz"),
+                        t,
+                        y,
+                        ids=np.asarray(ids, dtype=str),
+                    )
+                n += len(ids)
+        print(f"{file}: {n} scenarios solved")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+from os.path import dirname, isfile, join
+
+import numpy as np
+
+from .cache import solution_key
+from .example_coefficient_matrices import sweden_coefficients
+from .example_initial_conditions import y0_sweden
+from .example_contact_matrices import sweden_contact_matrix
+
+# Solution of the Sweden example shown at startup, bundled with the app so the
+# first figure does not wait for the solver. Regenerate it with
+# `python -m utils.default_solution` whenever the example or the solver changes.
+path = join(dirname(__file__), "default_solution.npz")
+
+duration = 100
+
+
+def default_inputs():
+    """Returns the inputs of the startup solve, in the order of
+    drawing.iter_solve_SEIRD after the duration
+    """
+    return y0_sweden, sweden_coefficients, sweden_contact_matrix, dict(), False
+
+
+def _key():
+    y0, coeff, contact, params_vac, vac_E = default_inputs()
+    # like drawing._key, vac_E only counts when somebody is vaccinated
+    vac_E = bool(vac_E and params_vac)
+    return solution_key(
+        np.asarray(y0), np.asarray(coeff), np.asarray(contact), params_vac, vac_E, 0.1
+    )
+
+
+def load_default_solution():
+    """Returns the bundled solution (t, y), None if it is missing or does not
+    match the current example
+    """
+    if not isfile(path):
+        return None
+    with np.load(path) as data:
+        t, y = data["t"], data["y"]
+        key = str(data["key"])
+    if t[-1] != duration or key != _key():
+        return None
+    return t, y
+
+
+def save_default_solution():
+    from seird_math import seird_math
+
+    y0, coeff, contact, params_vac, vac_E = default_inputs()
+    t, y = seird_math.solve_seird(
+        (0, duration), y0.astype(np.float64), coeff, contact, params_vac, vac_E, 0.1
+    )
+    np.savez_compressed(path, t=t, y=y, key=_key())
+
+
+if __name__ == "__main__":
+    save_default_solution()
@@ -2,16 +2,30 @@ from matplotlib.backends.backend_tkagg import (
     FigureCanvasTkAgg,
     NavigationToolbar2Tk,
 )
-from . import plots
-from seird_math import seird_math
+from .cache import SolutionCache, solution_key
+from .mathematics import solve_SEIRD_adaptive
+from .profiling import solve_seird, traced
 import numpy as np
 
+# Solutions of earlier draws, so switching back to a scenario or changing only
+# the duration skips (most of) the solve
+solution_cache = SolutionCache()
+
 
 class Toolbar(NavigationToolbar2Tk):
     def __init__(self, *args, **kwargs):
         super(Toolbar, self).__init__(*args, **kwargs)
 
 
+class FigureCanvas(FigureCanvasTkAgg):
+    """FigureCanvasTkAgg whose renders show up in the SEIRD_TRACE trace"""
+
+    @traced("FigureCanvasTkAgg.draw")
+    def draw(self):
+        super().draw()
+
+
+@traced("draw_fig")
 def draw_fig(canvas, fig, canvas_toolbar):
     """Draws the figure on the figure_canvas_agg
 
@@ -29,34 +43,160 @@ def draw_fig(canvas, fig, canvas_toolbar):
     if canvas_toolbar.children:
         for child in canvas_toolbar.winfo_children():
             child.destroy()
-    figure_canvas_agg = FigureCanvasTkAgg(fig, canvas)
+    figure_canvas_agg = FigureCanvas(fig, canvas)
     toolbar = Toolbar(figure_canvas_agg, canvas_toolbar)
     toolbar.update()
     figure_canvas_agg.get_tk_widget().pack(side="top", fill="both", expand=True)
     return figure_canvas_agg
 
 
-def delete_figure_agg(figure_canvas_agg):
-    """Deletes the figure_canvas_agg content
+def _key(y0, coeff, contact, params_vac, vac_E, dt, adaptive=False):
+    # vac_E only changes the solution when somebody is vaccinated
+    vac_E = bool(vac_E and params_vac)
+    inputs = [np.asarray(y0), np.asarray(coeff), np.asarray(contact)]
+    inputs += [params_vac, vac_E, dt]
+    if adaptive:
+        inputs.append("adaptive")
+    return solution_key(*inputs)
 
-    Args:
-        figure_canvas_agg (FigureCanvasTkAgg): The figure_canvas_agg from which
-            the content is deleted
+
+def cache_solution(t, y, y0, coeff, contact, params_vac=dict(), vac_E=True, dt=0.1):
+    """Stores a solution computed elsewhere, e.g. the bundled default one, so
+    drawing the same scenario skips the solve
+    """
+    solution_cache.put(_key(y0, coeff, contact, params_vac, vac_E, dt), t, y)
+
+
+def _solve_adaptive(time_range, y0, coeff, contact, params_vac, vac_E, dt):
+    """solve_seird on the adaptive solver, interpolated onto the same dt grid"""
+    n_steps = round((time_range[1] - time_range[0]) / dt)
+    t_eval = np.minimum(time_range[0] + dt * np.arange(n_steps + 1), time_range[1])
+    sol = solve_SEIRD_adaptive(
+        time_range, y0, coeff, contact, params_vac, vac_E, t_eval=t_eval
+    )
+    return sol.t, sol.y
+
+
+def iter_solve_SEIRD(
+    t_1,
+    y0,
+    coeff,
+    contact,
+    params_vac=dict(),
+    vac_E=True,
+    dt=0.1,
+    chunk=None,
+    adaptive=False,
+):
+    """Solves the model on (0, t_1), yielding the solution computed so far after
+    every chunk of simulated days (only once at the end when chunk is None).
+    With adaptive, the adaptive solver of seird_math solves it and its
+    solution is interpolated onto the steps of dt.
+
+    The cache keeps the longest horizon solved so far for every scenario. A
+    shorter horizon is a prefix of it, a longer one continues from its last
+    state and only integrates the extra days. A solve that is not iterated to
+    the end is not cached.
+
+    Yields:
+        t, y: Time points and solution from day 0 up to the current chunk
     """
-    for item in figure_canvas_agg.get_tk_widget().find_all():
-        figure_canvas_agg.get_tk_widget().delete(item)
-    figure_canvas_agg.get_tk_widget().pack_forget()
+    key = _key(y0, coeff, contact, params_vac, vac_E, dt, adaptive)
+    solve = _solve_adaptive if adaptive else solve_seird
+    cached = solution_cache.get(key)
+    if cached is not None and cached[0][-1] >= t_1 - dt / 2:
+        t, y = cached
+        n = np.searchsorted(t, t_1 + dt / 2)
+        yield t[:n], y[:, :n, :]
+        return
+
+    # room for every step up to t_1, the chunks are copied in and the
+    # solution so far is a view of its first n points
+    size = int(np.ceil(t_1 / dt)) + 2
+    t_all = np.empty(size)
+    y_all = np.empty((6, size, y0.shape[-1]))
+    if cached is None:
+        n = 0
+        t_start, y_start = 0, y0.astype(np.float64)
+    else:
+        n = len(cached[0])
+        t_all[:n], y_all[:, :n] = cached
+        t_start, y_start = cached[0][-1], np.ascontiguousarray(cached[1][:, -1, :])
+
+    while True:
+        t_end = min(t_1, t_start + chunk) if chunk else t_1
+        t, y = solve((t_start, t_end), y_start, coeff, contact, params_vac, vac_E, dt)
+        if n:
+            # the first point is the last one of the previous block
+            t, y = t[1:], y[:, 1:, :]
+        if n + len(t) > len(t_all):
+            # the solver may add a point to the estimate through rounding
+            size = max(2 * len(t_all), n + len(t))
+            t_all = np.concatenate([t_all[:n], np.empty(size - n)])
+            y_all = np.concatenate(
+                [y_all[:, :n], np.empty((6, size - n, y_all.shape[-1]))], axis=1
+            )
+        t_all[n : n + len(t)] = t
+        y_all[:, n : n + len(t)] = y
+        n += len(t)
+        t_start, y_start = t[-1], np.ascontiguousarray(y[:, -1, :])
+        if t_end >= t_1:
+            break
+        yield t_all[:n], y_all[:, :n]
+
+    t, y = t_all[:n], y_all[:, :n]
+    solution_cache.put(key, t, y)
+    yield t, y
 
 
-def create_updated_fig_SEIRD(
-    t_1, params, params_vac=dict(), screen_size=None, vac_E=True
+def stream_solve_SEIRD(
+    cancel, window, t_1, params, params_vac=dict(), vac_E=True, chunk=10, adaptive=False
 ):
-    y0 = params["-INITIALTAB-"]
-    coeff = params["-PARAMTAB-"]
-    contact = params["-CONTACTTAB-"]
-    t, y = seird_math.solve_seird(
-        (0, t_1), y0.astype(np.float64), coeff, contact, params_vac, vac_E, 0.1
+    """Solves the model, posting the progress to window, see
+    scheduler.SolveScheduler
+
+    Posts "-SOLVE-CHUNK-" with (cancel, t, y) after every chunk of simulated
+    days. Stops mid-way once cancel is set.
+
+    Args:
+        cancel (threading.Event): Set to stop the solve mid-way
+        window (sg.Window): The window receiving the events
+        t_1 (int): Duration of the simulation in days
+        chunk (int): Simulated days between two updates
+        adaptive (bool): Solve with the adaptive solver, see iter_solve_SEIRD
+
+    Returns:
+        t, y: The solution, None if cancelled
+    """
+    solves = iter_solve_SEIRD(
+        t_1,
+        params["-INITIALTAB-"],
+        params["-PARAMTAB-"],
+        params["-CONTACTTAB-"],
+        params_vac,
+        vac_E,
+        chunk=chunk,
+        adaptive=adaptive,
     )
+    for t, y in solves:
+        if cancel.is_set():
+            return None
+        window.write_event_value("-SOLVE-CHUNK-", (cancel, t, y))
+    return t, y
+
 
-    fig = plots.plot_SEIRD(t, y, screen_size)
-    return fig, t, y
+@traced("update_fig")
+def update_fig(figure_canvas_agg, plot, t, y):
+    """Shows a new solution in the figure already drawn on the canvas
+
+    Args:
+        figure_canvas_agg (FigureCanvasTkAgg): The canvas returned by draw_fig
+        plot (plots.SEIRDPlot): The plot drawn on that canvas
+        t (np.ndarray): Time points of the solution
+        y (np.ndarray): The solution
+    """
+    plot.update(t, y)
+    if figure_canvas_agg.toolbar is not None:
+        # the zoom history refers to the previous solution
+        figure_canvas_agg.toolbar.update()
+    figure_canvas_agg.draw_idle()
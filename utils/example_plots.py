@@ -58,7 +58,7 @@ def all_sol_in_grid(solutions):
     # plt.autoscale()
     for i in range(8):
         for j in range(6):
-            axs[i, j].plot(solutions[0], solutions[j + 1][:, i])
+            axs[i, j].plot(solutions.t, solutions.y[j][:, i])
             axs[i, j].ticklabel_format(axis="y", useOffset=False, style="plain")
     # plt.tight_layout()
     # plt.savefig("sweden_SEIRD.pdf", bbox_inches="tight")
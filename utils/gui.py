@@ -1,7 +1,6 @@
 import PySimpleGUI as sg
 from dataclasses import dataclass
 
-
 sg.theme("DarkGrey5")
 
 
@@ -142,6 +141,15 @@ def layout(screen_size):
         True,
     )
 
+    save_row = create_row(
+        create_stretch(),
+        sg.Button(
+            "Save solution", key="-SAVESOL-", size=settings.button_size, expand_x=True
+        ),
+        create_stretch(),
+        True,
+    )
+
     draw_row = create_row(
         create_stretch(),
         sg.Button("Plot", key="-DRAW-", size=settings.button_size, expand_x=True),
@@ -149,6 +157,19 @@ def layout(screen_size):
         True,
     )
 
+    cancel_row = create_row(
+        create_stretch(),
+        sg.Button(
+            "Cancel",
+            key="-CANCEL-",
+            size=settings.button_size,
+            expand_x=True,
+            disabled=True,
+        ),
+        create_stretch(),
+        True,
+    )
+
     column1 = sg.Column(
         [
             [duration_text_row],
@@ -158,7 +179,10 @@ def layout(screen_size):
             [create_stretch()],
             [stat_row],
             [create_stretch()],
+            [save_row],
+            [create_stretch()],
             [draw_row],
+            [cancel_row],
         ],
         justification="left",
         element_justification="c",
@@ -193,10 +217,10 @@ def layout(screen_size):
 
 
 # Create the param window layout
-from utils.example_initial_conditions import y0_sweden
-from utils.example_coefficient_matrices import sweden_coefficients
-from utils.example_contact_matrices import sweden_contact_matrix
-from utils.example_vac_params import default_vac_params
+from .example_initial_conditions import y0_sweden
+from .example_coefficient_matrices import sweden_coefficients
+from .example_contact_matrices import sweden_contact_matrix
+from .example_vac_params import default_vac_params
 import numpy as np
 
 params = {
@@ -464,8 +488,10 @@ def layout_stat(stats):
         " n ",
         "R_n0",
         "max(I_sn)",
+        "t(max(I_sn))",
         "max(I_an)",
         "D_n(t_max)",
+        "Attack rate",
     ]
 
     stat_table = sg.Table(
@@ -474,7 +500,7 @@ def layout_stat(stats):
         expand_x=True,
         expand_y=True,
         auto_size_columns=True,
-        # col_widths=[5, 9, 9, 9, 9],
+        # col_widths=[5, 9, 9, 9, 9, 9, 9],
         hide_vertical_scroll=True,
         justification="c",
         num_rows=len(stats),
@@ -1,4 +1,5 @@
 from . import model_equations
+from .profiling import Profile, span
 import numpy as np
 from dataclasses import dataclass
 
@@ -9,9 +10,147 @@ SEIRD_args = model_equations.SEIRD_args
 class solution:
     t: np.ndarray
     y: np.ndarray
+    t_stop: float = None
+    # spans and counters of the solve, see profiling.Profile
+    stats: Profile = None
 
 
-def solve_SEIRD(time_range, y0, coeff, contact_matrix, params_vac=dict(), vac_E=True):
+def compile_vac_schedule(params_vac, time_points, n_groups=8):
+    """Turns the vaccination parameters into a dense table of daily rates.
+
+    Every age_grp_n entry is a flat list of [rate, start, end] triples, one per
+    campaign. A campaign is active on days start <= t < end + 1 and the rates
+    of overlapping campaigns add up. The efficacy is not applied.
+
+    Returns:
+        np.ndarray: Vaccination rates of shape (len(time_points), n_groups)
+    """
+    time_points = np.asarray(time_points)
+    rates = np.zeros(shape=(len(time_points), n_groups))
+    if not params_vac:
+        return rates
+    for i in range(n_groups):
+        campaigns = np.asarray(params_vac.get(f"age_grp_{i+1}", []), dtype=np.float64)
+        for rate, start, end in campaigns.reshape(-1, 3):
+            rates[(start <= time_points) & (time_points < end + 1), i] += rate
+    return rates
+
+
+def as_contact_matrix(contact_matrix):
+    """Dense contact matrices become float arrays, scipy.sparse ones CSR."""
+    if hasattr(contact_matrix, "tocsr"):
+        return contact_matrix.tocsr()
+    return np.asarray(contact_matrix, dtype=np.float64)
+
+
+def contact_product(contact_matrix, infectious):
+    """contact_matrix @ infectious for the last axis of infectious.
+
+    Dense matrices may carry the batch axes of infectious, a sparse (n, n)
+    matrix is shared by the whole batch.
+    """
+    if isinstance(contact_matrix, np.ndarray):
+        return np.matmul(contact_matrix, infectious[..., None])[..., 0]
+    flat = infectious.reshape(-1, infectious.shape[-1])
+    return np.asarray(contact_matrix @ flat.T).T.reshape(infectious.shape)
+
+
+def compile_contact_schedule(
+    contact_matrix, time_points, contact_changes=None, contact_scale=None
+):
+    """Turns a schedule of contact changes into the matrix of every time point.
+
+    contact_changes is a list of (day, matrix) pairs sorted by day, each matrix
+    replacing the contacts from its day on. contact_scale of shape (days, n)
+    multiplies the contacts of every age group day by day, 1 after its last
+    row. Matrices may be dense or scipy.sparse.
+
+    Returns:
+        matrices (list): contact_matrix followed by the matrices of the changes
+        active (np.ndarray): Index into matrices of every time point
+        scale (np.ndarray): Factors of shape (len(time_points), n), or None
+    """
+    time_points = np.asarray(time_points)
+    days = np.floor(time_points + 1e-9)
+    contact_changes = contact_changes or []
+    starts = np.array([day for day, _ in contact_changes], dtype=np.float64)
+    if np.any(np.diff(starts) < 0):
+        raise ValueError("Contact change days must be sorted.")
+    matrices = [as_contact_matrix(contact_matrix)]
+    matrices += [as_contact_matrix(matrix) for _, matrix in contact_changes]
+    active = np.searchsorted(starts, days, side="right")
+
+    scale = None
+    if contact_scale is not None:
+        contact_scale = np.asarray(contact_scale, dtype=np.float64)
+        scale = np.ones((len(time_points), contact_scale.shape[-1]))
+        inside = (days >= 0) & (days < len(contact_scale))
+        scale[inside] = contact_scale[days[inside].astype(np.int64)]
+    return matrices, active, scale
+
+
+def last_vac_step(vac_rates):
+    """Index of the first step after which nobody is vaccinated any more.
+
+    Vaccination keeps moving S to R after the epidemic is over, so a solve may
+    only stop early from this step on.
+    """
+    active = np.flatnonzero(vac_rates.any(axis=-1))
+    return active[-1] + 1 if active.size else 0
+
+
+def burnt_out(y, stop_tol):
+    """Whether E + Is + Ia is below stop_tol in every age group (and scenario)."""
+    return bool(stop_tol) and bool(
+        (y[..., 1, :] + y[..., 2, :] + y[..., 3, :] < stop_tol).all()
+    )
+
+
+def solve_SEIRD(
+    time_range,
+    y0,
+    coeff,
+    contact_matrix,
+    params_vac=dict(),
+    vac_E=True,
+    engine="loop",
+    stop_tol=None,
+    contact_changes=None,
+    contact_scale=None,
+):
+    """Solves the SEIRD model with a daily RK4 step.
+
+    With stop_tol the solve ends once E + Is + Ia < stop_tol in every age group
+    and no vaccination is left; the last state is carried forward and the day
+    it stopped is returned as solution.t_stop. Contact schedules, see
+    compile_contact_schedule, need the vectorized engine. The "adaptive"
+    engine, see solve_SEIRD_adaptive, supports neither.
+    """
+    if engine == "adaptive":
+        if stop_tol or contact_changes or contact_scale is not None:
+            raise ValueError(
+                "The adaptive engine supports neither stop_tol nor contact schedules."
+            )
+        return solve_SEIRD_adaptive(
+            time_range, y0, coeff, contact_matrix, params_vac, vac_E
+        )
+    elif engine == "vectorized":
+        return solve_SEIRD_vectorized(
+            time_range,
+            y0,
+            coeff,
+            contact_matrix,
+            params_vac,
+            vac_E,
+            stop_tol,
+            contact_changes,
+            contact_scale,
+        )
+    elif engine != "loop":
+        raise ValueError(f"Unknown engine: {engine}")
+    elif contact_changes or contact_scale is not None:
+        raise ValueError("Contact schedules need the vectorized engine.")
+
     f = model_equations.SEIRD
     if vac_E:
         f = model_equations.SEIRD_SE
@@ -20,7 +159,7 @@ def solve_SEIRD(time_range, y0, coeff, contact_matrix, params_vac=dict(), vac_E=
     time_points = np.arange(time_range[0], time_range[1] + 1, dt)
     # have to create 48 solution place holders
     # row is values for for ex. S = |S0|S1|S2|S3|S4|S5|S6|S7|
-    (S, E, Is, Ia, R, D) = (np.zeros(shape=(len(time_points), 8)) for _ in range(6))
+    S, E, Is, Ia, R, D = (np.zeros(shape=(len(time_points), 8)) for _ in range(6))
     S[0, :] = y0[0, :]
     E[0, :] = y0[1, :]
     Is[0, :] = y0[2, :]
@@ -36,6 +175,10 @@ def solve_SEIRD(time_range, y0, coeff, contact_matrix, params_vac=dict(), vac_E=
     gamma_a = coeff[5, :]
     delta = coeff[6, :]
 
+    vac_rates = compile_vac_schedule(params_vac, time_points)
+    vac_end = last_vac_step(vac_rates)
+    t_stop = time_points[-1]
+
     if not params_vac:
         # for each time point
         for t in range(len(time_points) - 1):
@@ -59,7 +202,7 @@ def solve_SEIRD(time_range, y0, coeff, contact_matrix, params_vac=dict(), vac_E=
                     gamma_a[0, i],
                     delta[0, i],
                     sum_contact_Im,
-                    0,
+                    [0, 0] if vac_E else 0.0,
                 )
 
                 k1 = np.array(f(t, prev_y, args))
@@ -74,6 +217,13 @@ def solve_SEIRD(time_range, y0, coeff, contact_matrix, params_vac=dict(), vac_E=
                 Ia[t + 1, i] = new_y[3]
                 R[t + 1, i] = new_y[4]
                 D[t + 1, i] = new_y[5]
+
+            y_next = np.array([S[t + 1], E[t + 1], Is[t + 1], Ia[t + 1]])
+            if t + 1 >= vac_end and burnt_out(y_next, stop_tol):
+                for compartment in (S, E, Is, Ia, R, D):
+                    compartment[t + 2 :] = compartment[t + 1]
+                t_stop = time_points[t + 1]
+                break
     else:
         # for each time point
         for t in range(len(time_points) - 1):
@@ -88,14 +238,10 @@ def solve_SEIRD(time_range, y0, coeff, contact_matrix, params_vac=dict(), vac_E=
                     Is[t, :] + Ia[t, :]
                 )
 
-                if (
-                    params_vac[f"age_grp_{i+1}"][1]
-                    <= t
-                    <= params_vac[f"age_grp_{i+1}"][2]
-                ):
-                    vac_params = [params_vac["eff"], params_vac[f"age_grp_{i+1}"][0]]
-                else:
-                    vac_params = [0, 0]
+                # SEIRD_SE takes (efficacy, rate), SEIRD their product
+                vac_params = [params_vac["eff"][0], vac_rates[t, i]]
+                if not vac_E:
+                    vac_params = vac_params[0] * vac_params[1]
                 args = SEIRD_args(
                     beta[0, i],
                     sigma[0, i],
@@ -121,4 +267,235 @@ def solve_SEIRD(time_range, y0, coeff, contact_matrix, params_vac=dict(), vac_E=
                 R[t + 1, i] = new_y[4]
                 D[t + 1, i] = new_y[5]
 
-    return solution(np.array(time_points), np.array([S, E, Is, Ia, R, D]))
+            y_next = np.array([S[t + 1], E[t + 1], Is[t + 1], Ia[t + 1]])
+            if t + 1 >= vac_end and burnt_out(y_next, stop_tol):
+                for compartment in (S, E, Is, Ia, R, D):
+                    compartment[t + 2 :] = compartment[t + 1]
+                t_stop = time_points[t + 1]
+                break
+
+    return solution(np.array(time_points), np.array([S, E, Is, Ia, R, D]), t_stop)
+
+
+def solve_SEIRD_adaptive(
+    time_range,
+    y0,
+    coeff,
+    contact_matrix,
+    params_vac=dict(),
+    vac_E=True,
+    t_eval=None,
+    rtol=1e-6,
+    atol=1e-3,
+):
+    """Solves the SEIRD model with the adaptive Dormand-Prince solver of
+    seird_math, interpolated onto t_eval (every day by default).
+
+    The steps follow the local error, bounded by rtol and by atol in persons,
+    so they are long while nothing happens and short around the peaks.
+    """
+    from seird_math import seird_math
+
+    if t_eval is None:
+        t_eval = np.arange(time_range[0], time_range[1] + 1)
+    t, y = seird_math.solve_seird_adaptive(
+        time_range,
+        np.asarray(y0, dtype=np.float64),
+        np.asarray(coeff, dtype=np.float64),
+        np.asarray(contact_matrix, dtype=np.float64),
+        params_vac,
+        vac_E,
+        np.asarray(t_eval, dtype=np.float64),
+        rtol,
+        atol,
+    )
+    return solution(t, y, t[-1])
+
+
+def solve_SEIRD_vectorized(
+    time_range,
+    y0,
+    coeff,
+    contact_matrix,
+    params_vac=dict(),
+    vac_E=True,
+    stop_tol=None,
+    contact_changes=None,
+    contact_scale=None,
+    dt=1,
+):
+    """Solves the SEIRD model advancing all age groups in one RK4 step.
+
+    Takes the same arguments and returns the same solution as solve_SEIRD,
+    but every RK stage works on the whole (6, n) state at once and the
+    contact coupling is a single matrix-vector product per time step.
+    Leading batch axes on y0, coeff and contact_matrix are carried through,
+    see solve_SEIRD_batch. A batch stops early only once every scenario has
+    burnt out. The contacts may change over time, see
+    compile_contact_schedule, and may be scipy.sparse matrices for large
+    structures such as regions x age groups. solution.stats holds the time
+    spent compiling the schedules, allocating and integrating, and counts the
+    steps, RHS evaluations, clamped values and bytes allocated. dt is the
+    step in days, like the dt of seird_math.
+    """
+    f = model_equations.SEIRD_vectorized
+    if vac_E:
+        f = model_equations.SEIRD_SE_vectorized
+
+    dt2 = dt / 2
+    n_steps = round((time_range[1] - time_range[0]) / dt)
+    time_points = time_range[0] + dt * np.arange(n_steps + 1)
+    y0 = np.asarray(y0, dtype=np.float64)
+    coeff = np.asarray(coeff, dtype=np.float64)
+    batch_shape = y0.shape[:-2]
+    n_groups = y0.shape[-1]
+    stats = Profile()
+
+    with span("compile", stats):
+        matrices, active, scale = compile_contact_schedule(
+            contact_matrix, time_points, contact_changes, contact_scale
+        )
+        vac_rates = compile_vac_schedule(params_vac, time_points, n_groups)
+        if params_vac:
+            vac_rates *= params_vac["eff"][0]
+        vac_end = last_vac_step(vac_rates)
+    t_stop = time_points[-1]
+
+    with span("allocate", stats):
+        # y[..., :, t, :] is the whole population at time point t
+        y = np.zeros(shape=(*batch_shape, 6, len(time_points), n_groups))
+        y[..., 0, :] = y0
+
+    steps = clamps = 0
+    with span("integrate", stats):
+        for t in range(len(time_points) - 1):
+            prev_y = y[..., t, :]
+            infectious = prev_y[..., 2, :] + prev_y[..., 3, :]
+            sum_contact_Im = contact_product(matrices[active[t]], infectious)
+            if scale is not None:
+                sum_contact_Im = sum_contact_Im * scale[t]
+            args = SEIRD_args(*np.moveaxis(coeff, -2, 0), sum_contact_Im, vac_rates[t])
+
+            k1 = f(t, prev_y, args)
+            k2 = f(t + dt2, prev_y + dt2 * k1, args)
+            k3 = f(t + dt2, prev_y + dt2 * k2, args)
+            k4 = f(t + dt, prev_y + dt * k3, args)
+            new_y = prev_y + (dt / 6.0) * (k1 + 2 * k2 + 2 * k3 + k4)
+            clamps += np.count_nonzero(new_y < 0)
+            y[..., t + 1, :] = np.fmax(new_y, 0)
+            steps += 1
+
+            if t + 1 >= vac_end and burnt_out(y[..., t + 1, :], stop_tol):
+                y[..., t + 2 :, :] = y[..., t + 1, None, :]
+                t_stop = time_points[t + 1]
+                break
+
+    # counted per scenario and, for the RHS, per age group like seird_math
+    scenarios = int(np.prod(batch_shape))
+    stats.count("steps", steps * scenarios)
+    stats.count("rhs_evals", 4 * steps * scenarios * n_groups)
+    stats.count("clamps", clamps)
+    stats.count(
+        "bytes_allocated",
+        y.nbytes
+        + vac_rates.nbytes
+        + active.nbytes
+        + (0 if scale is None else scale.nbytes),
+    )
+    return solution(time_points, y, t_stop, stats)
+
+
+def extend_SEIRD(
+    sol,
+    t_end,
+    coeff,
+    contact_matrix,
+    params_vac=dict(),
+    vac_E=True,
+    stop_tol=None,
+    contact_changes=None,
+    contact_scale=None,
+    dt=1,
+):
+    """Continues a solution of the vectorized or batched solver up to t_end.
+
+    The solve restarts from the last state of sol, so a checkpointed run only
+    integrates the extra days. The result equals a single solve over the whole
+    horizon. A shorter t_end returns the matching prefix of sol.
+    """
+    if t_end <= sol.t[-1]:
+        n = np.searchsorted(sol.t, t_end, side="right")
+        return solution(sol.t[:n], sol.y[..., :n, :], min(sol.t_stop, sol.t[n - 1]))
+    rest = solve_SEIRD_vectorized(
+        (sol.t[-1], t_end),
+        sol.y[..., -1, :],
+        coeff,
+        contact_matrix,
+        params_vac,
+        vac_E,
+        stop_tol,
+        contact_changes,
+        contact_scale,
+        dt,
+    )
+    return solution(
+        np.concatenate([sol.t, rest.t[1:]]),
+        np.concatenate([sol.y, rest.y[..., 1:, :]], axis=-2),
+        rest.t_stop,
+        rest.stats,
+    )
+
+
+def solve_SEIRD_batch(
+    time_range,
+    y0,
+    coeff,
+    contact_matrix,
+    params_vac=dict(),
+    vac_E=True,
+    stop_tol=None,
+    contact_changes=None,
+    contact_scale=None,
+    dt=1,
+):
+    """Solves the SEIRD model for a whole ensemble of scenarios in one call.
+
+    Args:
+        time_range (tuple): First and last day of the simulation
+        y0 (np.ndarray): Initial values of shape (N, 6, 8)
+        coeff (np.ndarray): Coefficients of shape (N, 7, 8)
+        contact_matrix (np.ndarray): Contact matrices of shape (N, 8, 8), or a
+            single (8, 8) matrix shared by all scenarios
+        params_vac (dict): Vaccination parameters shared by all scenarios
+        vac_E (bool): Whether the E group is vaccinated as well
+        stop_tol (float): Stop once E + Is + Ia is below it everywhere
+        contact_changes (list): (day, matrix) pairs shared by all scenarios,
+            see compile_contact_schedule
+        contact_scale (np.ndarray): Daily contact factors of shape (days, 8)
+        dt (float): Time step in days
+
+    Returns:
+        solution: Time points and y of shape (N, 6, T, 8)
+    """
+    y0 = np.asarray(y0, dtype=np.float64)
+    coeff = np.asarray(coeff, dtype=np.float64)
+    contact_matrix = as_contact_matrix(contact_matrix)
+    if y0.ndim != 3 or y0.shape[1] != 6:
+        raise ValueError("Initial values must have shape (N, 6, n).")
+    n, _, n_groups = y0.shape
+    if coeff.shape != (n, 7, n_groups):
+        raise ValueError("Coefficients must have shape (N, 7, n).")
+    if contact_matrix.shape not in ((n_groups, n_groups), (n, n_groups, n_groups)):
+        raise ValueError("Contact matrix must have shape (n, n) or (N, n, n).")
+    return solve_SEIRD_vectorized(
+        time_range,
+        y0,
+        coeff,
+        contact_matrix,
+        params_vac,
+        vac_E,
+        stop_tol,
+        contact_changes,
+        contact_scale,
+        dt,
+    )
@@ -71,3 +71,53 @@ def SEIRD_SE(t, y, c: SEIRD_args):
     dDndt = c.delta_n * I_sn
 
     return np.array([dSndt, dEndt, dIsndt, dIandt, dRndt, dDndt])
+
+
+def SEIRD_vectorized(t, y, c: SEIRD_args):
+    """The SEIRD model for all age groups at once. Only S group is vaccinated.
+
+    Same equations as SEIRD, but y has shape (..., 6, n) and every field of c
+    is an array with one value per age group (and per scenario in a batch).
+    vac_params holds the vaccination rate (efficacy times daily rate) of each
+    group.
+    """
+    S_n, E_n, I_sn, I_an, R_n, D_n = np.moveaxis(y, -2, 0)
+    infection = c.beta_n * c.sigma_n * S_n * c.sum_m_contact_nm_times_I_m
+
+    diff_v = np.where(S_n - infection - c.vac_params < 0, S_n, c.vac_params)
+
+    dSndt = -infection - diff_v
+    dEndt = infection - c.epsilon_n * E_n
+    dIsndt = c.epsilon_n * c.f_sn * E_n - (c.gamma_sn + c.delta_n) * I_sn
+    dIandt = c.epsilon_n * (1 - c.f_sn) * E_n - c.gamma_an * I_an
+    dRndt = c.gamma_an * I_an + c.gamma_sn * I_sn + diff_v
+    dDndt = c.delta_n * I_sn
+
+    return np.stack([dSndt, dEndt, dIsndt, dIandt, dRndt, dDndt], axis=-2)
+
+
+def SEIRD_SE_vectorized(t, y, c: SEIRD_args):
+    """The SEIRD model for all age groups at once. SE groups are vaccinated.
+
+    Vectorized counterpart of SEIRD_SE, see SEIRD_vectorized for the shapes.
+    """
+    S_n, E_n, I_sn, I_an, R_n, D_n = np.moveaxis(y, -2, 0)
+    infection = c.beta_n * c.sigma_n * S_n * c.sum_m_contact_nm_times_I_m
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        vaccinated = (c.vac_params != 0) & (S_n / (S_n + E_n) < 1)
+        vac_S = np.where(vaccinated, c.vac_params * S_n / (S_n + E_n), 0)
+        vac_E = np.where(vaccinated, c.vac_params * E_n / (S_n + E_n), 0)
+    diff_v = np.where(vaccinated, c.vac_params, 0)
+
+    corr = np.where(S_n - infection - vac_S < 0, S_n, 0)
+    dSndt = -infection - vac_S - corr
+
+    corr = np.where(c.epsilon_n * E_n + vac_E > E_n + infection, E_n, corr)
+    dEndt = infection - c.epsilon_n * E_n - vac_E - corr
+    dIsndt = c.epsilon_n * c.f_sn * E_n - (c.gamma_sn + c.delta_n) * I_sn
+    dIandt = c.epsilon_n * (1 - c.f_sn) * E_n - c.gamma_an * I_an
+    dRndt = c.gamma_an * I_an + c.gamma_sn * I_sn + diff_v
+    dDndt = c.delta_n * I_sn
+
+    return np.stack([dSndt, dEndt, dIsndt, dIandt, dRndt, dDndt], axis=-2)
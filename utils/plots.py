@@ -1,5 +1,7 @@
 import matplotlib.pyplot as plt
 
+from .profiling import traced
+
 colors = [
     "#008fd5",
     "#fc4f30",
@@ -12,6 +14,7 @@ colors = [
 ]
 
 
+@traced("plot_SEIRD")
 def plot_SEIRD(t, y, screen_size):
     dpi = 100
     fig_width = 13
@@ -80,3 +83,26 @@ def plot_SEIRD(t, y, screen_size):
     #     transform=plt.gcf().transFigure,
     # )
     return fig
+
+
+class SEIRDPlot:
+    """The figure of plot_SEIRD kept alive between draws.
+
+    The axes and the 48 lines are created once, a redraw only swaps their
+    data and rescales the axes, so no figure, legend or style is rebuilt.
+    """
+
+    def __init__(self, t, y, screen_size):
+        self.fig = plot_SEIRD(t, y, screen_size)
+        # fig.axes is row major, the same order as the compartments in y
+        self.lines = [ax.get_lines() for ax in self.fig.axes]
+
+    @traced("SEIRDPlot.update")
+    def update(self, t, y):
+        for ax, lines, compartment in zip(self.fig.axes, self.lines, y):
+            for i, line in enumerate(lines):
+                line.set_data(t, compartment[:, i])
+            # zooming or panning in the toolbar turns autoscaling off
+            ax.set_autoscale_on(True)
+            ax.relim()
+            ax.autoscale_view()
@@ -0,0 +1,165 @@
+"""Timing spans and counters of the solve pipeline.
+
+A Profile adds up the seconds spent in named spans and counts events such as
+RK steps or clamped values. The solvers return one with their solution.
+
+Setting SEIRD_TRACE to a file path also records every span of the process,
+from parameter validation to drawing the figure, and writes them at exit in
+the Chrome trace format (chrome://tracing or https://ui.perfetto.dev):
+
+    SEIRD_TRACE=trace.json python model.pyw
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import wraps
+
+trace_file = os.environ.get("SEIRD_TRACE") or None
+
+_events = []
+_start = time.perf_counter()
+
+
+@dataclass
+class Profile:
+    # seconds by span name, in the order the spans first ran
+    spans: dict = field(default_factory=dict)
+    counters: dict = field(default_factory=dict)
+
+    def add(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + int(n)
+
+    def merge(self, other):
+        for name, seconds in other.spans.items():
+            self.add(name, seconds)
+        for name, n in other.counters.items():
+            self.count(name, n)
+
+    @classmethod
+    def from_dict(cls, stats):
+        """The stats dict of the seird_math *_profiled solvers: the spans in
+        "spans", the day the solve stopped in "t_stop", every other key a
+        counter
+        """
+        stats = dict(stats)
+        stats.pop("t_stop", None)
+        return cls(dict(stats.pop("spans")), stats)
+
+
+@contextmanager
+def span(name, profile=None, **args):
+    """Times the block into profile and, with SEIRD_TRACE, into the trace.
+    Costs nothing when neither is on.
+    """
+    if profile is None and trace_file is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        if profile is not None:
+            profile.add(name, seconds)
+        if trace_file is not None:
+            record(name, start, seconds, **args)
+
+
+def traced(name):
+    """Decorator recording every call of the function as a span of the trace.
+    The function is returned unchanged when SEIRD_TRACE is not set.
+    """
+
+    def decorator(fn):
+        if trace_file is None:
+            return fn
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def record(name, start, seconds, **args):
+    """Adds a complete event to the trace, start being a time.perf_counter()"""
+    _events.append(
+        {
+            "name": name,
+            "ph": "X",
+            "ts": (start - _start) * 1e6,
+            "dur": seconds * 1e6,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": args,
+        }
+    )
+
+
+def record_profile(name, profile, start):
+    """Adds the spans of profile to the trace one after another from start,
+    nested in a span of their total, and its counters as a counter event
+    """
+    total = sum(profile.spans.values())
+    record(name, start, total)
+    for span_name, seconds in profile.spans.items():
+        record(span_name, start, seconds)
+        start += seconds
+    if profile.counters:
+        _events.append(
+            {
+                "name": name,
+                "ph": "C",
+                "ts": (start - _start) * 1e6,
+                "pid": os.getpid(),
+                "args": profile.counters,
+            }
+        )
+
+
+def dump(file=None):
+    """Writes the trace recorded so far, to SEIRD_TRACE by default"""
+    with open(file or trace_file, "w") as f:
+        json.dump({"traceEvents": _events, "displayTimeUnit": "ms"}, f)
+
+
+if trace_file is not None:
+    atexit.register(dump)
+
+
+def solve_seird(*args, profile=None):
+    """seird_math.solve_seird, adding the spans and counters of the solver to
+    profile and the trace when either is on
+
+    The time of the call not spent in the solver itself, converting the
+    arguments (vac_params above all) and the results, is the span
+    "call overhead".
+    """
+    from seird_math import seird_math
+
+    if profile is None and trace_file is None:
+        return seird_math.solve_seird(*args)
+    start = time.perf_counter()
+    t, y, stats = seird_math.solve_seird_profiled(*args)
+    seconds = time.perf_counter() - start
+    stats = Profile.from_dict(stats)
+    stats.spans = {
+        "call overhead": seconds - sum(stats.spans.values()),
+        **stats.spans,
+    }
+    if profile is not None:
+        profile.merge(stats)
+    if trace_file is not None:
+        record_profile("solve_seird", stats, start)
+    return t, y
@@ -0,0 +1,407 @@
+"""Golden solutions and the comparison of the solver backends against them.
+
+    python -m utils.regression generate tests/golden.npz
+    python -m utils.regression check tests/golden.npz --rtol 1e-6 --atol 1e-3
+
+The golden file keeps the inputs of every scenario next to its reference
+solutions, so a check never depends on how the corpus was generated.
+Solutions are compared on whole days, where every backend and dt has a point.
+The committed tests/golden.npz comes from the daily loop engine, the kernel
+every other backend was derived from.
+"""
+
+import argparse
+import json
+import sys
+from dataclasses import dataclass
+
+import numpy as np
+
+from .example_coefficient_matrices import sweden_coefficients
+from .example_contact_matrices import mozambique_contact_matrix, sweden_contact_matrix
+from .example_initial_conditions import y0_sweden, y0_sweden_alternative
+from .example_vac_params import default_vac_params
+from .mathematics import solve_SEIRD, solve_SEIRD_vectorized
+from .statistics import ngm_R0
+
+_vac_groups = [f"age_grp_{i}" for i in range(1, 9)]
+
+# R0 of the example scenarios. The example coefficients give about 80, an
+# epidemic a daily step can't follow.
+example_R0 = 2.5
+
+
+@dataclass
+class Scenario:
+    y0: np.ndarray
+    coeff: np.ndarray
+    contact: np.ndarray
+    params_vac: dict
+    vac_E: bool
+
+
+def _scenario(y0, coeff, contact, params_vac, vac_E):
+    return Scenario(
+        np.asarray(y0, dtype=np.float64),
+        np.asarray(coeff, dtype=np.float64),
+        np.asarray(contact, dtype=np.float64),
+        params_vac,
+        vac_E,
+    )
+
+
+def _with_R0(y0, coeff, contact, R0):
+    """coeff with beta scaled so that the scenario has the basic reproduction
+    number R0
+    """
+    coeff = np.array(coeff, dtype=np.float64)
+    coeff[0] *= R0 / ngm_R0(np.asarray(y0, dtype=np.float64), coeff, contact)
+    return coeff
+
+
+def random_scenario(rng):
+    """A valid scenario with a single seeded case in a random age group, an R0
+    between 1.2 and 4 and a random vaccination campaign for every group
+    """
+    y0 = np.zeros((6, 8))
+    y0[0] = rng.integers(5e4, 3e5, size=8)
+    y0[2, rng.integers(8)] = 1
+    coeff = np.array(
+        [
+            rng.uniform(1e-6, 1e-5, 8),
+            rng.uniform(0.01, 1, 8),
+            rng.uniform(0.1, 0.5, 8),
+            rng.uniform(0.2, 0.9, 8),
+            rng.uniform(0.03, 0.2, 8),
+            rng.uniform(0.03, 0.2, 8),
+            rng.uniform(1e-7, 2e-3, 8),
+        ]
+    )
+    contact = rng.uniform(0, 4, (8, 8))
+    start = rng.integers(0, 100, 8)
+    params_vac = {"eff": [float(np.round(rng.uniform(0.5, 1), 2))]}
+    for k, s, rate, length in zip(
+        _vac_groups, start, rng.integers(0, 5000, 8), rng.integers(1, 60, 8)
+    ):
+        params_vac[k] = [int(rate), int(s), int(s + length)]
+    coeff = _with_R0(y0, coeff, contact, rng.uniform(1.2, 4))
+    return _scenario(y0, coeff, contact, params_vac, bool(rng.integers(2)))
+
+
+def corpus(n_random=4, seed=0):
+    """The example scenarios at example_R0, with and without vaccination and
+    with and without vac_E, and n_random random ones
+
+    Returns:
+        scenarios (dict): Scenario by name
+    """
+    scenarios = {}
+    examples = {
+        "sweden": (y0_sweden, sweden_contact_matrix),
+        "mozambique": (y0_sweden_alternative, mozambique_contact_matrix),
+    }
+    for name, (y0, contact) in examples.items():
+        coeff = _with_R0(y0, sweden_coefficients, contact, example_R0)
+        scenarios[name] = _scenario(y0, coeff, contact, dict(), False)
+        scenarios[f"{name}-E"] = _scenario(y0, coeff, contact, dict(), True)
+        scenarios[f"{name}-vac"] = _scenario(
+            y0, coeff, contact, default_vac_params(), False
+        )
+        scenarios[f"{name}-vac-E"] = _scenario(
+            y0, coeff, contact, default_vac_params(), True
+        )
+    rng = np.random.default_rng(seed)
+    for i in range(n_random):
+        scenarios[f"random-{i}"] = random_scenario(rng)
+    return scenarios
+
+
+def _python(engine):
+    def solve(s, horizon, dt):
+        args = (
+            (0, horizon),
+            np.matrix(s.y0),
+            np.matrix(s.coeff),
+            np.matrix(s.contact),
+            s.params_vac,
+            s.vac_E,
+        )
+        if engine == "vectorized":
+            solution = solve_SEIRD_vectorized(*args, dt=dt)
+        else:
+            solution = solve_SEIRD(*args, engine)
+        return solution.t, solution.y
+
+    return solve
+
+
+def _rust(s, horizon, dt):
+    from seird_math import seird_math
+
+    return seird_math.solve_seird(
+        (0, horizon), s.y0, s.coeff, s.contact, s.params_vac, s.vac_E, dt
+    )
+
+
+def _rust_batch(s, horizon, dt):
+    from seird_math import seird_math
+
+    t, y = seird_math.solve_seird_batch(
+        (0, horizon),
+        s.y0[None],
+        s.coeff[None],
+        s.contact[None],
+        s.params_vac,
+        s.vac_E,
+        dt,
+        1,
+    )
+    return t, y[0]
+
+
+# name: (solve(scenario, horizon, dt) -> (t, y), the dts it supports or None
+# for any). Register an optimized kernel here to check it against the golden
+# solutions.
+backends = {
+    "python-loop": (_python("loop"), [1.0]),
+    "python-vectorized": (_python("vectorized"), None),
+    "rust": (_rust, None),
+    "rust-batch": (_rust_batch, None),
+}
+
+
+def daily(t, y):
+    """The points of a solution (6, T, n) that fall on whole days"""
+    t = np.asarray(t, dtype=np.float64)
+    on_day = np.abs(t - np.round(t)) < 1e-6
+    return np.round(t[on_day]), np.asarray(y)[..., on_day, :]
+
+
+@dataclass
+class Difference:
+    max_abs: float
+    max_rel: float
+    # (compartment, day, age group) of the worst violation of the tolerance
+    worst: tuple
+    ok: bool
+
+
+def compare(t, y, t_ref, y_ref, rtol=1e-6, atol=1e-3):
+    """Compares two solutions on their common whole days, elementwise with
+    |y - y_ref| <= atol + rtol * |y_ref| like np.isclose
+
+    Returns:
+        difference (Difference): Largest deviations and whether all are
+            within the tolerance
+    """
+    t, y = daily(t, y)
+    t_ref, y_ref = daily(t_ref, y_ref)
+    days, i, i_ref = np.intersect1d(t, t_ref, return_indices=True)
+    if len(days) != len(t_ref):
+        raise ValueError(f"The solutions share {len(days)} of {len(t_ref)} days.")
+    y, y_ref = y[:, i, :], y_ref[:, i_ref, :]
+    # a NaN or overflow counts as an infinite deviation unless both have it
+    same = (y == y_ref) | (np.isnan(y) & np.isnan(y_ref))
+    with np.errstate(invalid="ignore"):
+        diff = np.abs(y - y_ref)
+    diff = np.where(same, 0, np.where(np.isfinite(diff), diff, np.inf))
+    excess = diff - (atol + rtol * np.abs(y_ref))
+    # relative to atol where the reference is about 0
+    rel = diff / np.maximum(np.abs(y_ref), atol)
+    worst = np.unravel_index(np.argmax(excess), diff.shape)
+    return Difference(
+        max_abs=float(diff.max()),
+        max_rel=float(rel.max()),
+        worst=(int(worst[0]), float(days[worst[1]]), int(worst[2])),
+        ok=bool((excess <= 0).all()),
+    )
+
+
+def bounded(y, max_growth=0.5):
+    """Whether a solution (6, T, n) is finite and no age group ever grows by
+    more than max_growth of its population at the start
+
+    The compartments only exchange people, so an unstable step shows up as a
+    growing population long before it overflows. Clamping negative values
+    after a step adds a few percent where a vaccination campaign outruns the
+    S and E groups, which is not a blow-up.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    if not np.isfinite(y).all():
+        return False
+    population = y.sum(axis=0)
+    return bool((population <= population[0] * (1 + max_growth)).all())
+
+
+def _supports(backend, dt):
+    dts = backends[backend][1]
+    return dts is None or any(np.isclose(dt, d) for d in dts)
+
+
+def _pack_vac(params_vac):
+    if not params_vac:
+        return np.zeros(0), np.zeros((0, 3))
+    campaigns = [np.asarray(params_vac[k], dtype=np.float64) for k in _vac_groups]
+    return np.asarray(params_vac["eff"], dtype=np.float64), np.array(campaigns)
+
+
+def _unpack_vac(eff, campaigns):
+    if not len(campaigns):
+        return dict()
+    params_vac = {"eff": eff.tolist()}
+    for k, c in zip(_vac_groups, campaigns):
+        params_vac[k] = [int(v) if v.is_integer() else v for v in c.tolist()]
+    return params_vac
+
+
+def save_golden(file, scenarios, backend="python-loop", dts=(1.0,), horizon=200):
+    """Solves every scenario with backend at every dt and saves the inputs and
+    solutions as the reference of check_golden
+
+    Returns:
+        unstable (list): Names of the scenarios whose solution is not bounded
+    """
+    solve = backends[backend][0]
+    for dt in dts:
+        if not _supports(backend, dt):
+            raise ValueError(f"The {backend} backend does not support dt={dt}.")
+    unstable = []
+    arrays = {
+        "names": np.array(list(scenarios), dtype=str),
+        "dts": np.asarray(dts, dtype=np.float64),
+        "horizon": np.array(horizon),
+        "backend": np.array(backend),
+    }
+    for name, s in scenarios.items():
+        eff, campaigns = _pack_vac(s.params_vac)
+        arrays.update(
+            {
+                f"{name}/y0": s.y0,
+                f"{name}/coeff": s.coeff,
+                f"{name}/contact": s.contact,
+                f"{name}/vac_eff": eff,
+                f"{name}/vac": campaigns,
+                f"{name}/vac_E": np.array(s.vac_E),
+            }
+        )
+        for k, dt in enumerate(dts):
+            t, y = daily(*solve(s, horizon, dt))
+            arrays[f"{name}/t/{k}"] = t
+            arrays[f"{name}/y/{k}"] = y
+            if not bounded(y) and name not in unstable:
+                unstable.append(name)
+    np.savez_compressed(file, **arrays)
+    return unstable
+
+
+def load_golden(file):
+    """Loads a file of save_golden
+
+    Returns:
+        scenarios (dict): Scenario by name
+        solutions (dict): (t, y) by (name, dt)
+        meta (dict): The horizon and the backend of the solutions
+    """
+    scenarios, solutions = {}, {}
+    with np.load(file) as data:
+        dts = data["dts"].tolist()
+        for name in data["names"].tolist():
+            scenarios[name] = _scenario(
+                data[f"{name}/y0"],
+                data[f"{name}/coeff"],
+                data[f"{name}/contact"],
+                _unpack_vac(data[f"{name}/vac_eff"], data[f"{name}/vac"]),
+                bool(data[f"{name}/vac_E"]),
+            )
+            for k, dt in enumerate(dts):
+                solutions[name, dt] = data[f"{name}/t/{k}"], data[f"{name}/y/{k}"]
+        meta = {"horizon": int(data["horizon"]), "backend": str(data["backend"])}
+    return scenarios, solutions, meta
+
+
+def check_golden(file, names=None, rtol=1e-6, atol=1e-3):
+    """Runs every backend in names (all registered ones when None) at every
+    golden dt it supports and compares it with the golden solutions
+
+    Returns:
+        results (list): One dict per scenario, backend and dt with the
+            Difference fields, or the error the backend raised
+    """
+    scenarios, solutions, meta = load_golden(file)
+    results = []
+    for backend in names or list(backends):
+        solve = backends[backend][0]
+        for (name, dt), (t_ref, y_ref) in solutions.items():
+            if not _supports(backend, dt):
+                continue
+            result = {"scenario": name, "backend": backend, "dt": dt}
+            try:
+                t, y = solve(scenarios[name], meta["horizon"], dt)
+                result.update(vars(compare(t, y, t_ref, y_ref, rtol, atol)))
+                if not bounded(y):
+                    result.update(ok=False, error="The solution is not bounded")
+            except Exception as e:
+                result.update(ok=False, error=f"{type(e).__name__}: {e}")
+            results.append(result)
+    return results
+
+
+def _summary(result):
+    head = f"{result['scenario']:<18} {result['backend']:<18} dt={result['dt']:<5}"
+    if "error" in result:
+        return f"FAIL {head} {result['error']}"
+    return (
+        f"{'ok  ' if result['ok'] else 'FAIL'} {head} max abs {result['max_abs']:.3g}"
+        f" max rel {result['max_rel']:.3g} worst (y, day, n) {result['worst']}"
+    )
+
+
+def parser():
+    p = argparse.ArgumentParser(
+        prog="python -m utils.regression",
+        description="Generate golden solutions or check the solvers against them.",
+    )
+    commands = p.add_subparsers(dest="command", required=True)
+    generate = commands.add_parser("generate", help="Write the golden solutions")
+    generate.add_argument("file")
+    generate.add_argument("--backend", default="python-loop", choices=list(backends))
+    generate.add_argument("--dt", nargs="+", type=float, default=[1.0])
+    generate.add_argument("--horizon", type=int, default=200)
+    generate.add_argument("--random", type=int, default=4, help="Random scenarios")
+    generate.add_argument("--seed", type=int, default=0)
+
+    check = commands.add_parser("check", help="Compare the backends with a file")
+    check.add_argument("file")
+    check.add_argument("--backend", nargs="+", choices=list(backends), default=None)
+    check.add_argument("--rtol", type=float, default=1e-6)
+    check.add_argument("--atol", type=float, default=1e-3, help="In persons")
+    check.add_argument("--report", default=None, help="Write the results as JSON")
+    return p
+
+
+def main(argv=None):
+    args = parser().parse_args(argv)
+    if args.command == "generate":
+        scenarios = corpus(args.random, args.seed)
+        unstable = save_golden(
+            args.file, scenarios, args.backend, args.dt, args.horizon
+        )
+        print(f"{len(scenarios)} scenarios written to {args.file}")
+        if unstable:
+            print(f"Unbounded solutions: {', '.join(unstable)}")
+            return 1
+        return 0
+
+    results = check_golden(args.file, args.backend, args.rtol, args.atol)
+    for result in results:
+        print(_summary(result))
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(results, f, indent=2)
+    failed = sum(not r["ok"] for r in results)
+    print(f"{len(results) - failed} of {len(results)} within tolerance")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
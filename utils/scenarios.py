@@ -0,0 +1,131 @@
+import numpy as np
+
+from .validation import validate_params_batch
+
+# Long format of a scenario catalogue: one row per scenario and parameter with
+# the value of every age group in the columns "1" to "8". The parameter names
+# are those of the spreadsheet sheets, the contact matrix comes row by row.
+initial_names = ["Sn", "En", "Isn", "Ian", "Rn", "Dn"]
+param_names = ["beta", "sigma", "epsilon", "fs", "gamma_s", "gamma_a", "delta"]
+contact_names = [f"contact_{i}" for i in range(1, 9)]
+parameter_names = initial_names + param_names + contact_names
+group_columns = [str(i) for i in range(1, 9)]
+
+
+def _read_chunks(file, chunk_rows):
+    """Yields the rows of a CSV or Parquet catalogue as data frames"""
+    if file.lower().endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        columns = ["scenario", "parameter"] + group_columns
+        for batch in pq.ParquetFile(file).iter_batches(
+            batch_size=chunk_rows, columns=columns
+        ):
+            yield batch.to_pandas()
+    else:
+        import pandas as pd
+
+        dtype = {"scenario": str, "parameter": str}
+        dtype.update({c: np.float64 for c in group_columns})
+        yield from pd.read_csv(file, chunksize=chunk_rows, dtype=dtype)
+
+
+def _pivot(frame):
+    """Turns the rows of whole scenarios into (ids, y0, coeff, contact)"""
+    import pandas as pd
+
+    codes, ids = pd.factorize(frame["scenario"], sort=False)
+    params = pd.Categorical(frame["parameter"], categories=parameter_names).codes
+    if (params < 0).any():
+        unknown = frame["parameter"][params < 0].unique()[:10]
+        raise ValueError(f"Unknown parameters: {', '.join(map(str, unknown))}")
+
+    counts = np.zeros((len(ids), len(parameter_names)), dtype=np.int64)
+    np.add.at(counts, (codes, params), 1)
+    incomplete = (counts != 1).any(axis=1)
+    if incomplete.any():
+        raise ValueError(
+            "Every scenario needs exactly one row per parameter. Scenarios: "
+            + ", ".join(map(str, np.asarray(ids)[incomplete][:10]))
+        )
+
+    data = np.empty((len(ids), len(parameter_names), len(group_columns)))
+    data[codes, params] = frame[group_columns].to_numpy(dtype=np.float64)
+    n_init, n_param = len(initial_names), len(param_names)
+    return (
+        np.asarray(ids),
+        np.ascontiguousarray(data[:, :n_init]),
+        np.ascontiguousarray(data[:, n_init : n_init + n_param]),
+        np.ascontiguousarray(data[:, n_init + n_param :]),
+    )
+
+
+def read_scenarios(file, chunk_size=1024):
+    """Streams the scenarios of a CSV or Parquet catalogue in validated chunks
+
+    The rows of a scenario must be contiguous, a scenario is never split
+    between two chunks.
+
+    Args:
+        file (str): Path of a .csv or .parquet file
+        chunk_size (int): Approximate number of scenarios per chunk
+
+    Yields:
+        ids, y0, coeff, contact: Scenario names and arrays of shape (N, 6, 8),
+            (N, 7, 8) and (N, 8, 8)
+    """
+    rest = None
+    for frame in _read_chunks(file, chunk_size * len(parameter_names)):
+        if rest is not None:
+            frame = _concat(rest, frame)
+        # the last scenario may continue in the next chunk
+        last = frame["scenario"].iloc[-1]
+        tail = (frame["scenario"] == last).to_numpy()
+        rest = frame[tail]
+        frame = frame[~tail]
+        if len(frame):
+            yield _validated(*_pivot(frame))
+    if rest is not None and len(rest):
+        yield _validated(*_pivot(rest))
+
+
+def _concat(first, second):
+    import pandas as pd
+
+    return pd.concat([first, second], ignore_index=True)
+
+
+def _validated(ids, y0, coeff, contact):
+    validate_params_batch(y0, coeff, contact, ids)
+    return ids, y0, coeff, contact
+
+
+def solve_scenarios(
+    file,
+    t_1,
+    params_vac=dict(),
+    vac_E=True,
+    dt=0.1,
+    workers=0,
+    chunk_size=1024,
+    t_out=None,
+):
+    """Solves every scenario of a catalogue, one batched solve per chunk
+
+    Args:
+        t_1 (int): Duration of the simulation in days
+        params_vac (dict): Vaccination parameters shared by all scenarios
+        workers (int): Solver threads, 0 uses every core
+        t_out (np.ndarray): Time points to keep, every step when None
+
+    Yields:
+        ids, t, y: Scenario names, time points and solutions of shape
+            (N, 6, T, 8)
+    """
+    from seird_math import seird_math
+
+    for ids, y0, coeff, contact in read_scenarios(file, chunk_size):
+        t, y = seird_math.solve_seird_batch(
+            (0, t_1), y0, coeff, contact, params_vac, vac_E, dt, workers, t_out
+        )
+        yield ids, t, y
@@ -0,0 +1,82 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+
+class SolveScheduler:
+    """Runs the computations of the GUI in a thread pool and posts their results
+    back to the window as events.
+
+    Every request has a kind, e.g. "SOLVE" or "STAT". Submitting a request
+    supersedes the pending or running request of the same kind: its cancel
+    event is set and its result is dropped. The solvers release the GIL, so
+    threads are enough to keep the Tk main loop responsive.
+
+    Events posted to the window:
+        -<kind>-DONE-: (cancel, result) once a request that is still current
+            finishes
+        -<kind>-ERROR-: (cancel, exception) if it raises instead
+    """
+
+    def __init__(self, window, workers=2):
+        self.window = window
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="solve")
+        self.lock = threading.Lock()
+        self.requests = dict()
+
+    def submit(self, kind, fn, *args, **kwargs):
+        """Runs fn(cancel, *args, **kwargs) in the pool
+
+        fn should return early once cancel is set.
+
+        Returns:
+            cancel (threading.Event): The cancel event of the request
+        """
+        cancel = threading.Event()
+        with self.lock:
+            self._drop(kind)
+            future = self.pool.submit(self._run, kind, cancel, fn, args, kwargs)
+            self.requests[kind] = (cancel, future)
+        return cancel
+
+    def cancel(self, kind):
+        """Drops the pending or running request of the given kind"""
+        with self.lock:
+            self._drop(kind)
+
+    def is_current(self, kind, cancel):
+        """Whether cancel belongs to the latest request of the given kind"""
+        with self.lock:
+            request = self.requests.get(kind)
+        return request is not None and request[0] is cancel and not cancel.is_set()
+
+    def busy(self, kind):
+        """Whether a request of the given kind is pending or running"""
+        with self.lock:
+            request = self.requests.get(kind)
+        return request is not None and not request[1].done()
+
+    def shutdown(self):
+        """Drops every request and stops the pool without waiting for it"""
+        with self.lock:
+            for kind in list(self.requests):
+                self._drop(kind)
+        self.pool.shutdown(wait=False)
+
+    def _drop(self, kind):
+        request = self.requests.pop(kind, None)
+        if request is not None:
+            cancel, future = request
+            cancel.set()
+            future.cancel()
+
+    def _run(self, kind, cancel, fn, args, kwargs):
+        if cancel.is_set():
+            return
+        try:
+            result = fn(cancel, *args, **kwargs)
+        except Exception as e:
+            if not cancel.is_set():
+                self.window.write_event_value(f"-{kind}-ERROR-", (cancel, e))
+            return
+        if not cancel.is_set():
+            self.window.write_event_value(f"-{kind}-DONE-", (cancel, result))
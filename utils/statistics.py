@@ -0,0 +1,128 @@
+import numpy as np
+
+# Statistics of one age group, see group_stats
+stats_dtype = np.dtype(
+    [
+        ("R0", np.float64),
+        ("peak_Is", np.float64),
+        ("t_peak_Is", np.float64),
+        ("peak_Ia", np.float64),
+        ("t_peak_Ia", np.float64),
+        ("deaths", np.float64),
+        ("cumulative_incidence", np.float64),
+        ("attack_rate", np.float64),
+    ]
+)
+
+
+def _coefficients(coeff):
+    """Splits coefficients of shape (..., 7, n) into the seven (..., n) rows"""
+    return np.moveaxis(np.asarray(coeff, dtype=np.float64), -2, 0)
+
+
+def infectious_period(coeff):
+    """Mean time an exposed individual spends infectious, per age group
+
+    A fraction f_s of them becomes symptomatic and leaves through recovery or
+    death, the rest is asymptomatic.
+    """
+    beta, sigma, epsilon, f_s, gamma_s, gamma_a, delta = _coefficients(coeff)
+    return f_s / (gamma_s + delta) + (1 - f_s) / gamma_a
+
+
+def group_R0(y0, coeff, contact):
+    """Basic reproduction number of each age group on its own
+
+    The infections caused in group n by the infectious of group n, if everyone
+    it contacts were as susceptible as group n. Shape (..., n).
+    """
+    beta, sigma = _coefficients(coeff)[:2]
+    S0 = np.asarray(y0, dtype=np.float64)[..., 0, :]
+    contacts = np.asarray(contact, dtype=np.float64).sum(axis=-1)
+    return beta * sigma * S0 * contacts * infectious_period(coeff)
+
+
+def next_generation_matrix(y0, coeff, contact):
+    """K[n, m]: infections in group n caused by one infectious of group m at the
+    start of the epidemic. Shape (..., n, n).
+    """
+    beta, sigma = _coefficients(coeff)[:2]
+    S0 = np.asarray(y0, dtype=np.float64)[..., 0, :]
+    contact = np.asarray(contact, dtype=np.float64)
+    return (
+        (beta * sigma * S0)[..., :, None]
+        * contact
+        * infectious_period(coeff)[..., None, :]
+    )
+
+
+def ngm_R0(y0, coeff, contact):
+    """Basic reproduction number of the whole population, the spectral radius of
+    the next generation matrix. Shape (...).
+    """
+    return np.abs(np.linalg.eigvals(next_generation_matrix(y0, coeff, contact))).max(
+        axis=-1
+    )
+
+
+def incidence(y, coeff, contact):
+    """Rate of new infections of every age group, shape (..., T, n)
+
+    Args:
+        y (np.ndarray): Solution of shape (..., 6, T, n)
+    """
+    beta, sigma = _coefficients(coeff)[:2]
+    S, I_s, I_a = y[..., 0, :, :], y[..., 2, :, :], y[..., 3, :, :]
+    contact = np.asarray(contact, dtype=np.float64)
+    force = np.matmul(I_s + I_a, np.swapaxes(contact, -1, -2))
+    return (beta * sigma)[..., None, :] * S * force
+
+
+def cumulative_incidence(t, y, coeff, contact):
+    """Number of infections since t[0] of every age group, shape (..., T, n)
+
+    Integrates incidence with the trapezoidal rule, so vaccinations (which
+    also leave S) are not counted. Coarse outputs give coarse integrals.
+    """
+    rate = incidence(y, coeff, contact)
+    dt = np.diff(t)[:, None]
+    steps = (rate[..., 1:, :] + rate[..., :-1, :]) * dt / 2
+    return np.concatenate(
+        [np.zeros_like(rate[..., :1, :]), np.cumsum(steps, axis=-2)], axis=-2
+    )
+
+
+def group_stats(t, y, coeff, contact):
+    """Statistics of every age group of a solution or a batch of solutions
+
+    Args:
+        t (np.ndarray): Time points of shape (T,)
+        y (np.ndarray): Solutions of shape (..., 6, T, n)
+        coeff (np.ndarray): Coefficients of shape (7, n) or (..., 7, n)
+        contact (np.ndarray): Contact matrix of shape (n, n) or (..., n, n)
+
+    Returns:
+        stats (np.ndarray): Record array of shape (..., n) with stats_dtype
+    """
+    t = np.asarray(t, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    y0 = y[..., :, 0, :]
+    I_s, I_a = y[..., 2, :, :], y[..., 3, :, :]
+    infected = cumulative_incidence(t, y, coeff, contact)[..., -1, :]
+
+    stats = np.empty(y.shape[:-3] + y.shape[-1:], dtype=stats_dtype)
+    stats["R0"] = group_R0(y0, coeff, contact)
+    stats["peak_Is"] = I_s.max(axis=-2)
+    stats["t_peak_Is"] = t[I_s.argmax(axis=-2)]
+    stats["peak_Ia"] = I_a.max(axis=-2)
+    stats["t_peak_Ia"] = t[I_a.argmax(axis=-2)]
+    stats["deaths"] = y[..., 5, -1, :]
+    stats["cumulative_incidence"] = infected
+    stats["attack_rate"] = infected / y0.sum(axis=-2)
+    return stats
+
+
+def attack_rate(t, y, coeff, contact):
+    """Fraction of the whole population infected since t[0], shape (...)"""
+    infected = cumulative_incidence(t, y, coeff, contact)[..., -1, :]
+    return infected.sum(axis=-1) / y[..., :, 0, :].sum(axis=(-2, -1))
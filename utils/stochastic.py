@@ -0,0 +1,181 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from os import cpu_count
+
+import numpy as np
+
+from .mathematics import compile_vac_schedule, contact_product
+
+
+@dataclass
+class stochastic_solution:
+    t: np.ndarray
+    quantiles: np.ndarray
+    # (len(quantiles), 6, T, n) quantile bands over the replicates
+    y: np.ndarray
+    # (6, T, n) mean over the replicates
+    mean: np.ndarray
+    # (T,) fraction of the replicates with nobody left in E, Is or Ia
+    extinct: np.ndarray
+    replicates: int
+
+
+def _probability(rate, tau):
+    """Probability of leaving a compartment within tau at a constant rate"""
+    return -np.expm1(-rate * tau)
+
+
+def _share(numerator, denominator):
+    """numerator / denominator clipped to [0, 1], 0 where the denominator is 0"""
+    share = np.divide(
+        numerator,
+        denominator,
+        out=np.zeros(np.broadcast(numerator, denominator).shape),
+        where=denominator > 0,
+    )
+    return np.clip(share, 0, 1)
+
+
+def _step(rng, y, tau, coeff, contact, vac, vac_E):
+    """Advances the counts y (B, 6, n) of a block of replicates by one tau leap
+
+    Every transition out of a compartment is a binomial draw from its count at
+    the start of the leap, so no compartment ever turns negative.
+    """
+    beta, sigma, epsilon, f_s, gamma_s, gamma_a, delta = coeff
+    S, E, Is, Ia, R, D = np.moveaxis(y, -2, 0)
+
+    force = beta * sigma * contact_product(contact, (Is + Ia).astype(np.float64))
+    infected = rng.binomial(S, _probability(force, tau))
+    S_left = S - infected
+    # vac people a day, spread over S and E in proportion like SEIRD_SE
+    if vac_E:
+        p_vac = _share(vac * tau, S + E)
+        vac_S = rng.binomial(S_left, p_vac)
+        vac_En = rng.binomial(E, p_vac)
+    else:
+        vac_S = rng.binomial(S_left, _share(vac * tau, S_left))
+        vac_En = 0
+
+    onset = rng.binomial(E - vac_En, _probability(epsilon, tau))
+    symptomatic = rng.binomial(onset, f_s)
+    Is_out = rng.binomial(Is, _probability(gamma_s + delta, tau))
+    deaths = rng.binomial(Is_out, _share(delta, gamma_s + delta))
+    Ia_out = rng.binomial(Ia, _probability(gamma_a, tau))
+
+    return np.stack(
+        [
+            S_left - vac_S,
+            E + infected - onset - vac_En,
+            Is + symptomatic - Is_out,
+            Ia + onset - symptomatic - Ia_out,
+            R + Is_out - deaths + Ia_out + vac_S + vac_En,
+            D + deaths,
+        ],
+        axis=-2,
+    )
+
+
+def _advance(rng, y, first, last, tau, coeff, contact, vac, vac_E):
+    for step in range(first, last):
+        y = _step(rng, y, tau, coeff, contact, vac[step], vac_E)
+    return y
+
+
+def solve_SEIRD_stochastic(
+    time_range,
+    y0,
+    coeff,
+    contact_matrix,
+    params_vac=dict(),
+    vac_E=True,
+    replicates=1000,
+    seed=0,
+    tau=0.1,
+    quantiles=(0.05, 0.25, 0.5, 0.75, 0.95),
+    t_out=None,
+    workers=0,
+    block_size=1024,
+):
+    """Simulates the SEIRD model as a stochastic process with tau leaping.
+
+    Individuals move between compartments in binomial draws with the rates of
+    the ODE model, so small outbreaks can die out, e.g. the single seeded case
+    of y0_sweden. Only the quantile bands, the mean and the extinct fraction
+    at the output days are kept, never the trajectories of the replicates.
+
+    The replicates run in blocks of block_size, each with its own random
+    stream spawned from seed, spread over `workers` threads (0 uses every
+    core). The result depends on seed and block_size, not on workers.
+
+    Args:
+        time_range (tuple): First and last day of the simulation
+        y0 (np.ndarray): Initial counts of shape (6, n), rounded to integers
+        coeff (np.ndarray): Coefficients of shape (7, n)
+        contact_matrix (np.ndarray): Contact matrix of shape (n, n)
+        params_vac (dict): Vaccination parameters, see compile_vac_schedule
+        vac_E (bool): Whether the E group is vaccinated as well
+        replicates (int): Number of simulated epidemics
+        seed (int): Seed of the random streams
+        tau (float): Length of a leap in days
+        quantiles (tuple): Quantiles of the bands
+        t_out (np.ndarray): Sorted output days, every whole day when None
+
+    Returns:
+        stochastic_solution: The bands of shape (len(quantiles), 6, T, n)
+    """
+    y0 = np.rint(np.asarray(y0, dtype=np.float64)).astype(np.int64)
+    coeff = np.asarray(coeff, dtype=np.float64)
+    contact = np.asarray(contact_matrix, dtype=np.float64)
+    quantiles = np.asarray(quantiles, dtype=np.float64)
+    n_groups = y0.shape[-1]
+
+    n_steps = int(round((time_range[1] - time_range[0]) / tau))
+    time_points = time_range[0] + tau * np.arange(n_steps + 1)
+    if t_out is None:
+        t_out = np.arange(time_range[0], time_range[1] + tau / 2)
+    out_steps = np.rint((np.asarray(t_out, dtype=np.float64) - time_range[0]) / tau)
+    if np.any(np.diff(out_steps) < 0) or out_steps[0] < 0 or out_steps[-1] > n_steps:
+        raise ValueError("t_out must be sorted and lie within time_range.")
+    out_steps = out_steps.astype(np.int64)
+
+    vac = compile_vac_schedule(params_vac, time_points, n_groups)
+    if params_vac:
+        vac *= params_vac["eff"][0]
+
+    starts = range(0, replicates, block_size)
+    rngs = [
+        np.random.default_rng(s)
+        for s in np.random.SeedSequence(seed).spawn(len(starts))
+    ]
+    blocks = [
+        np.broadcast_to(y0, (min(block_size, replicates - i), 6, n_groups)).copy()
+        for i in starts
+    ]
+
+    T = len(out_steps)
+    bands = np.empty((len(quantiles), 6, T, n_groups))
+    mean = np.empty((6, T, n_groups))
+    extinct = np.empty(T)
+    step = 0
+    with ThreadPoolExecutor(workers or cpu_count()) as pool:
+        for k, out_step in enumerate(out_steps):
+            # the blocks only meet at the output days, to reduce their states
+            blocks = list(
+                pool.map(
+                    lambda rng, y: _advance(
+                        rng, y, step, out_step, tau, coeff, contact, vac, vac_E
+                    ),
+                    rngs,
+                    blocks,
+                )
+            )
+            step = out_step
+            y = np.concatenate(blocks)
+            bands[:, :, k, :] = np.quantile(y, quantiles, axis=0)
+            mean[:, k, :] = y.mean(axis=0)
+            extinct[k] = np.mean(~(y[:, 1:4, :] > 0).any(axis=(1, 2)))
+
+    return stochastic_solution(
+        time_points[out_steps], quantiles, bands, mean, extinct, replicates
+    )
@@ -0,0 +1,228 @@
+import struct
+import zipfile
+
+import numpy as np
+
+# Scenarios and solutions are stored as uncompressed .npz archives. Every
+# member is a plain .npy file (a short header followed by the raw buffer), so
+# large solution tensors can be memory-mapped straight out of the archive.
+
+_vac_groups = [f"age_grp_{i}" for i in range(1, 9)]
+
+
+def save_scenario(file, parameters, vac_parameters, with_vac=True):
+    """Saves the parameters and vaccination parameters of a scenario
+
+    Campaigns are stored flattened with the number of values of every age
+    group, so any number of (rate, start, end) triples per group round-trips.
+    with_vac records whether the scenario runs with its vaccination, the GUI
+    keeps the campaigns of an unvaccinated scenario for later.
+    """
+    campaigns = [
+        np.asarray(vac_parameters.get(k, []), dtype=np.float64) for k in _vac_groups
+    ]
+    np.savez(
+        file,
+        initial=np.asarray(parameters["-INITIALTAB-"], dtype=np.int64),
+        param=np.asarray(parameters["-PARAMTAB-"], dtype=np.float64),
+        contact=np.asarray(parameters["-CONTACTTAB-"], dtype=np.float64),
+        vac_eff=np.asarray(vac_parameters["eff"], dtype=np.float64),
+        vac=np.concatenate(campaigns),
+        vac_lengths=np.array([len(c) for c in campaigns], dtype=np.int64),
+        with_vac=np.array(with_vac),
+    )
+
+
+def load_scenario(file):
+    """Loads a scenario saved by save_scenario
+
+    Returns:
+        params, vac_params: In the same form as load_from_disk in model.pyw
+    """
+    with np.load(file) as data:
+        params = {
+            "-INITIALTAB-": np.matrix(data["initial"], dtype=np.int64),
+            "-PARAMTAB-": np.matrix(data["param"], dtype=np.float64),
+            "-CONTACTTAB-": np.matrix(data["contact"], dtype=np.float64),
+        }
+        vac_params = {"eff": data["vac_eff"].tolist()}
+        campaigns = np.split(data["vac"], np.cumsum(data["vac_lengths"])[:-1])
+    for k, c in zip(_vac_groups, campaigns):
+        # rates and days are whole numbers in the parameter window
+        vac_params[k] = [int(v) if v.is_integer() else v for v in c.tolist()]
+    return params, vac_params
+
+
+def scenario_with_vac(file):
+    """Whether a scenario saved by save_scenario runs with its vaccination,
+    True for files saved before the flag was stored
+    """
+    with np.load(file) as data:
+        return bool(data["with_vac"]) if "with_vac" in data else True
+
+
+def save_solution(file, t, y, **extra):
+    """Saves a solution, or a batch of them, with any extra arrays
+
+    Args:
+        file (str): Path of the .npz archive
+        t (np.ndarray): Time points of shape (T,)
+        y (np.ndarray): Solution of shape (..., 6, T, n)
+    """
+    np.savez(file, t=t, y=y, **extra)
+
+
+def load_solution(file, mmap=True):
+    """Loads a solution saved by save_solution
+
+    Args:
+        mmap (bool): Memory-map y read-only instead of reading it, so slicing
+            a large ensemble only reads the slices
+
+    Returns:
+        t, y: The solution
+    """
+    with np.load(file) as data:
+        t = data["t"]
+        y = None if mmap else data["y"]
+    if y is None:
+        y = memmap_member(file, "y")
+    return t, y
+
+
+def memmap_member(file, name):
+    """Memory-maps an array stored uncompressed in a .npz archive
+
+    Falls back to reading the array when the member is compressed.
+    """
+    with zipfile.ZipFile(file) as archive:
+        info = archive.getinfo(name + ".npy")
+    if info.compress_type != zipfile.ZIP_STORED:
+        with np.load(file) as data:
+            return data[name]
+
+    with open(file, "rb") as f:
+        # local file header: 30 bytes, then the name and the extra field
+        f.seek(info.header_offset)
+        header = f.read(30)
+        name_length, extra_length = struct.unpack("<HH", header[26:30])
+        f.seek(info.header_offset + 30 + name_length + extra_length)
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+    return np.memmap(
+        file,
+        dtype=dtype,
+        mode="r",
+        offset=offset,
+        shape=shape,
+        order="F" if fortran_order else "C",
+    )
+
+
+def save_scenario_xlsx(file, parameters, vac_parameters):
+    """Saves a scenario as the spreadsheet edited by hand, one sheet per table"""
+    import pandas as pd
+
+    initial_values = parameters["-INITIALTAB-"].astype(np.int64)
+    param_values = parameters["-PARAMTAB-"].astype(np.float64)
+    contact_values = parameters["-CONTACTTAB-"].astype(np.float64)
+
+    initial_values = np.insert(initial_values, 0, [i for i in range(1, 9)], axis=0)
+    initial_value_headers = ["n", "Sn", "En", "Isn", "Ian", "Rn", "Dn"]
+    initial_df = pd.DataFrame(initial_values, index=initial_value_headers)
+
+    param_values = np.insert(
+        param_values,
+        0,
+        [i for i in range(1, 9)],
+        axis=0,
+    )
+    param_headers = [
+        "n",
+        "beta",
+        "sigma",
+        "epsilon",
+        "fs",
+        "gamma_s",
+        "gamma_a",
+        "delta",
+    ]
+    param_df = pd.DataFrame(param_values, index=param_headers)
+
+    contact_values = np.insert(
+        contact_values,
+        0,
+        [i for i in range(1, 9)],
+        axis=1,
+    )
+    contact_headers = ["n", "1", "2", "3", "4", "5", "6", "7", "8"]
+    contact_df = pd.DataFrame(contact_values, columns=contact_headers)
+
+    eff_df = pd.DataFrame([[vac_parameters["eff"][0]]], columns=["eff"])
+
+    # one row per age group with a (rate, start, end) triple per campaign,
+    # the groups with fewer campaigns padded with empty cells
+    vac_data = []
+    vac_index = []
+    for k, v in vac_parameters.items():
+        if k == "eff":
+            continue
+        vac_index.append(k)
+        vac_data.append(list(v))
+    n_campaigns = max((len(v) // 3 for v in vac_data), default=1)
+    vac_columns = ["rate", "start", "end"]
+    for c in range(2, n_campaigns + 1):
+        vac_columns += [f"rate_{c}", f"start_{c}", f"end_{c}"]
+    vac_data = [v + [None] * (len(vac_columns) - len(v)) for v in vac_data]
+    vac_df = pd.DataFrame(vac_data, index=vac_index, columns=vac_columns)
+
+    with pd.ExcelWriter(file) as writer:
+        initial_df.to_excel(
+            writer, sheet_name="Initial values", index=True, header=False
+        )
+        param_df.to_excel(writer, sheet_name="Parameters", index=True, header=False)
+        contact_df.to_excel(
+            writer, sheet_name="Contact matrix", index=False, header=True
+        )
+        eff_df.to_excel(
+            writer, sheet_name="Vaccination efficacy", index=False, header=True
+        )
+        vac_df.to_excel(
+            writer, sheet_name="Vaccination parameters", index=True, header=True
+        )
+
+
+def load_scenario_xlsx(file):
+    """Loads a scenario saved by save_scenario_xlsx
+
+    Returns:
+        params, vac_params: In the same form as load_scenario
+    """
+    import pandas as pd
+
+    file = pd.ExcelFile(file)
+    initial = np.matrix(file.parse(0, dtype=str).iloc[:, 1:], dtype=np.int64)
+    param = np.matrix(file.parse(1, dtype=str).iloc[:, 1:], dtype=np.float64)
+    contact = np.matrix(file.parse(2, dtype=str).iloc[:, 1:], dtype=np.float64)
+    eff = file.parse(3, dtype=str).to_numpy(dtype=np.float64).flatten()
+    # the empty cells pad groups with fewer campaigns
+    vac = [
+        row.dropna().to_numpy(dtype=np.int64).tolist()
+        for _, row in file.parse(4, dtype=str).iloc[:, 1:].iterrows()
+    ]
+
+    vac_params = {"eff": [eff[0]]}
+    vac_head = [f"age_grp_{i}" for i in range(1, 9)]
+    for i in range(len(vac)):
+        vac_params[vac_head[i]] = vac[i]
+
+    params = {
+        "-INITIALTAB-": initial,
+        "-PARAMTAB-": param,
+        "-CONTACTTAB-": contact,
+    }
+    return params, vac_params
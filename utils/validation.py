@@ -1,6 +1,157 @@
 import numpy as np
+from dataclasses import dataclass
 
+from .profiling import traced
 
+# One violation of a rule, see ValidationReport. scenario is 0 for a single
+# scenario, row and col index the table (or the age group and the position in
+# its campaign list for the vaccination parameters).
+issue_dtype = np.dtype(
+    [
+        ("scenario", np.int64),
+        ("table", "U11"),
+        ("row", np.int64),
+        ("col", np.int64),
+        ("rule", np.int64),
+    ]
+)
+
+rules = [
+    "Initial values must be integers.",
+    "Parameters must be a floating point numbers.",
+    "Contact values must be a floating point numbers.",
+    "Initial values must be positive numbers.",
+    "Parameters must be positive numbers.",
+    "Parameters sigma, epsilon, f_s, gamma_s, gamma_a, delta should be a positive number less or equal to 1.",
+    "Contact values must be positive numbers.",
+    "Vaccination efficiency must be a floating point number.",
+    "Vaccination efficiency must be between 0 and 1.",
+    "Every vaccination campaign needs a rate, start day and end day.",
+    "All values like vaccination rate, start day, end day must be positive integers.",
+    "Start day must be less than or equal to end day for all age groups.",
+    "All values like vaccination rate, start day, end day must be positive numbers.",
+]
+
+
+@dataclass
+class ValidationReport:
+    """Every violation found, one issue_dtype record each. True when nothing
+    is violated.
+    """
+
+    issues: np.ndarray
+
+    def __bool__(self):
+        return not len(self.issues)
+
+    def scenarios(self):
+        """Indexes of the scenarios with at least one violation"""
+        return np.unique(self.issues["scenario"])
+
+    def messages(self):
+        """The violated rules, in the order of rules"""
+        return [rules[i] for i in np.unique(self.issues["rule"])]
+
+    def raise_first(self, ids=None):
+        """Raises ValueError for the first violated rule, naming the scenarios
+        when ids is given
+        """
+        if self:
+            return
+        rule = self.issues["rule"].min()
+        msg = rules[rule]
+        if ids is not None:
+            scenarios = np.unique(self.issues["scenario"][self.issues["rule"] == rule])
+            msg += f" Scenarios: {', '.join(map(str, np.asarray(ids)[scenarios][:10]))}"
+        raise ValueError(msg)
+
+
+def _issues(table, rule, invalid):
+    """Records of the violations in a (N, rows, cols) mask"""
+    where = np.argwhere(invalid)
+    issues = np.empty(len(where), dtype=issue_dtype)
+    issues["scenario"], issues["row"], issues["col"] = where.T
+    issues["table"] = table
+    issues["rule"] = rule
+    return issues
+
+
+def _report(*issues):
+    issues = np.concatenate(issues)
+    return ValidationReport(
+        issues[
+            np.lexsort(
+                (issues["col"], issues["row"], issues["rule"], issues["scenario"])
+            )
+        ]
+    )
+
+
+def check_params(y0, coeff, contact):
+    """
+    Checks the parameters of one scenario or a batch of scenarios, with the
+    leading batch axis on every table.
+
+    Args:
+        y0 (np.ndarray): Initial values of shape (6, n) or (N, 6, n)
+        coeff (np.ndarray): Coefficients of shape (7, n) or (N, 7, n)
+        contact (np.ndarray): Contact matrices of shape (n, n) or (N, n, n)
+
+    Returns:
+        report (ValidationReport): Every violation
+    """
+    y0 = np.asarray(y0, dtype=np.float64).reshape(-1, *np.shape(y0)[-2:])
+    coeff = np.asarray(coeff, dtype=np.float64).reshape(-1, *np.shape(coeff)[-2:])
+    contact = np.asarray(contact, dtype=np.float64).reshape(-1, *np.shape(contact)[-2:])
+    with np.errstate(invalid="ignore"):
+        return _report(
+            _issues("initial", 0, ~np.isfinite(y0) | (y0 != np.round(y0))),
+            _issues("param", 1, ~np.isfinite(coeff)),
+            _issues("contact", 2, ~np.isfinite(contact)),
+            _issues("initial", 3, y0 < 0),
+            _issues("param", 4, coeff < 0),
+            _issues(
+                "param", 5, (coeff > 1) & (np.arange(coeff.shape[1]) >= 1)[:, None]
+            ),
+            _issues("contact", 6, contact < 0),
+        )
+
+
+def check_params_vac(vac_params):
+    """
+    Checks the vaccination parameters, shared by every scenario of a batch.
+
+    Returns:
+        report (ValidationReport): Every violation
+    """
+    issues = []
+    eff = vac_params["eff"][0]
+    if not isinstance(eff, float):
+        issues.append(_issues("vaccination", 7, np.ones((1, 1, 1), dtype=bool)))
+    elif eff < 0 or eff > 1:
+        issues.append(_issues("vaccination", 8, np.ones((1, 1, 1), dtype=bool)))
+
+    for i in range(8):
+        campaigns = vac_params[f"age_grp_{i + 1}"]
+        if not campaigns or len(campaigns) % 3:
+            invalid = np.zeros((1, 8, 1), dtype=bool)
+            invalid[0, i] = True
+            issues.append(_issues("vaccination", 9, invalid))
+            continue
+        values = np.asarray(campaigns, dtype=np.float64).reshape(-1, 3)
+        is_int = np.array(
+            [isinstance(v, (int, np.integer)) for v in campaigns]
+        ).reshape(-1, 3)
+        late_start = np.zeros_like(is_int)
+        late_start[:, 1:] = (values[:, 1] > values[:, 2])[:, None]
+        for rule, invalid in ((10, ~is_int), (11, late_start), (12, values < 0)):
+            found = _issues("vaccination", rule, invalid.reshape(1, 1, -1))
+            found["row"] = i
+            issues.append(found)
+    return _report(np.empty(0, dtype=issue_dtype), *issues)
+
+
+@traced("validate_params")
 def validate_params(params):
     """
     Validates the parameters passed to the script.
@@ -11,48 +162,31 @@ def validate_params(params):
         raise ValueError("Parameters must be a floating point numbers.")
     if params["-CONTACTTAB-"].dtype != np.float64:
         raise ValueError("Contact values must be a floating point numbers.")
-    for x in params["-INITIALTAB-"].flat:
-        if x < 0:
-            raise ValueError("Initial values must be positive numbers.")
-    for x in params["-PARAMTAB-"].flat:
-        if x < 0:
-            raise ValueError("Parameters must be positive numbers.")
-    for i in range(len(params["-PARAMTAB-"])):
-        if i >= 1:
-            for x in params["-PARAMTAB-"][i].flat:
-                if x > 1:
-                    raise ValueError(
-                        "Parameters sigma, epsilon, f_s, gamma_s, gamma_a, delta should be a positive number less or equal to 1."
-                    )
-    for x in params["-CONTACTTAB-"].flat:
-        if x < 0:
-            raise ValueError("Contact values must be positive numbers.")
+    check_params(
+        params["-INITIALTAB-"], params["-PARAMTAB-"], params["-CONTACTTAB-"]
+    ).raise_first()
     return True
 
 
+@traced("validate_params_batch")
+def validate_params_batch(y0, coeff, contact, ids=None):
+    """
+    Validates a batch of scenarios at once, with the rules of validate_params.
+
+    Args:
+        y0 (np.ndarray): Initial values of shape (N, 6, n)
+        coeff (np.ndarray): Coefficients of shape (N, 7, n)
+        contact (np.ndarray): Contact matrices of shape (N, n, n)
+        ids (np.ndarray): Names of the scenarios used in the error messages
+    """
+    ids = np.arange(len(y0)) if ids is None else ids
+    check_params(y0, coeff, contact).raise_first(ids)
+    return True
+
+
+@traced("validate_params_vac")
 def validate_params_vac(vac_params):
-    if not isinstance(vac_params["eff"][0], float):
-        raise ValueError("Vaccination efficiency must be a floating point number.")
-    if vac_params["eff"][0] < 0 or vac_params["eff"][0] > 1:
-        raise ValueError("Vaccination efficiency must be between 0 and 1.")
-    for i in range(1, 9):
-        grp = f"age_grp_{i}"
-        if (
-            not isinstance(vac_params[grp][0], int)
-            or not isinstance(vac_params[grp][1], int)
-            or not isinstance(vac_params[grp][2], int)
-        ):
-            raise ValueError(
-                "All values like vaccination rate, start day, end day must be positive integers."
-            )
-        if vac_params[grp][1] > vac_params[grp][2]:
-            raise ValueError(
-                "Start day must be less than or equal to end day for all age groups."
-            )
-        if vac_params[grp][0] < 0 or vac_params[grp][1] < 0 or vac_params[grp][2] < 0:
-            raise ValueError(
-                "All values like vaccination rate, start day, end day must be positive numbers."
-            )
+    check_params_vac(vac_params).raise_first()
     return True
 
 